@@ -0,0 +1,36 @@
+import os
+import multiprocessing
+from uvicorn.workers import UvicornWorker
+
+# Production server profile shared by the backend services.
+# Each container runs gunicorn managing uvicorn workers (uvloop + httptools),
+# sized to the available cores unless WEB_CONCURRENCY is set.
+
+host = os.environ.get("HOST", "0.0.0.0")
+port = os.environ.get("PORT", "8080")
+
+bind = os.environ.get("BIND", f"{host}:{port}")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gunicorn_conf.ProductionWorker"
+
+
+class ProductionWorker(UvicornWorker):
+    """ Uvicorn worker pinned to the uvloop event loop and httptools parser """
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+
+# Seconds a worker may be silent before it is killed and restarted
+timeout = int(os.environ.get("TIMEOUT", 120))
+
+# Seconds to drain in-flight requests after SIGTERM before workers are killed
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+
+keepalive = int(os.environ.get("KEEP_ALIVE", 5))
+
+# Recycle workers periodically to bound memory growth
+max_requests = int(os.environ.get("MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", 1000))
+
+loglevel = os.environ.get("LOG_LEVEL", "info")
+accesslog = "-"
+errorlog = "-"
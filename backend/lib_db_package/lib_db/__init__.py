@@ -1 +1,2 @@
-from .db import DatabaseInterface
\ No newline at end of file
+from .db import DatabaseInterface
+from .batcher import WriteBatcher
@@ -0,0 +1,17 @@
+from .base import Backend
+
+
+def open_backend(connection_string: str, database_name: str):
+    """
+    Open the storage backend selected by the connection string's scheme.
+
+    :param connection_string: A sqlite:// URL for the embedded SQLite backend, otherwise a MongoDB connection string.
+    :param database_name: The name of the database.
+    :return: The backend.
+    """
+    if connection_string and connection_string.startswith("sqlite://"):
+        from .sqlite import SQLiteBackend
+        return SQLiteBackend(connection_string, database_name)
+
+    from .mongo import MongoBackend
+    return MongoBackend(connection_string, database_name)
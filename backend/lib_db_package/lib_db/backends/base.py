@@ -0,0 +1,81 @@
+from abc import ABC, abstractmethod
+
+
+class Backend(ABC):
+    """
+    Storage primitives behind DatabaseInterface.
+
+    Backends raise on errors, DatabaseInterface logs them and returns None. Documents are returned
+    with their primary key as a string 'id' field, and update operations use MongoDB's update syntax.
+    'raw' asks for lazily decoded documents where the backend has them (RawBSONDocument on MongoDB),
+    backends without one return plain dicts, which callers read the same way.
+    """
+
+    @abstractmethod
+    def find_one(self, collection_name: str, filter_criteria: dict, projection: dict = None, raw: bool = False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_all(self, collection_name: str, filter_criteria: dict = None, projection: dict = None, raw: bool = False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_documents(self, collection_name: str, filter_criteria: dict = None, projection: dict = None,
+                       after_id: str = None, batch_size: int = 500):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_one(self, collection_name: str, document: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_many(self, collection_name: str, documents: list):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_one(self, collection_name: str, filter_criteria: dict, update: dict, upsert: bool = False,
+                   array_filters: list = None):
+        """
+        :return: A (modified count, upserted ID) tuple.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_one_and_update(self, collection_name: str, filter_criteria: dict, update: dict, upsert: bool = False):
+        """
+        Atomically update a single document.
+
+        :return: The document after the update, or None if no document matched.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_one(self, collection_name: str, filter_criteria: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def bulk_write(self, collection_name: str, operations: list, ordered: bool = True):
+        """
+        :return: The number of operations applied before the first failure.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_index(self, collection_name: str, keys: list, **kwargs):
+        raise NotImplementedError
+
+    @abstractmethod
+    def drop_index(self, collection_name: str, keys: list):
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_nearby_locations(self, collection_name: str, reference_location, radius: int,
+                              projection: dict = None, raw: bool = False, limit: int = 0):
+        """
+        :return: The locations within the radius of [latitude, longitude], nearest first.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def close(self):
+        raise NotImplementedError
@@ -0,0 +1,160 @@
+import logging
+import pymongo
+from pymongo import ReturnDocument
+from bson.codec_options import CodecOptions
+from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import BulkWriteError
+from .base import Backend
+
+
+class MongoBackend(Backend):
+    """ MongoDB storage backend, running queries as aggregation pipelines on the server """
+
+    def __init__(self, connection_string, database_name):
+        self.client = pymongo.MongoClient(connection_string)
+        self.database = self.client[database_name]
+
+    def get_collection(self, collection_name: str, raw: bool = False):
+        """
+        Returns the given collection, optionally decoding documents as RawBSONDocument.
+
+        :param collection_name: The name of the MongoDB collection.
+        :param raw: (Optional) Return documents as RawBSONDocument, decoding fields lazily on access.
+        :return: The collection
+        """
+        collection = self.database[collection_name]
+
+        if raw:
+            return collection.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+        return collection
+
+    @staticmethod
+    def project_id(projection: dict = None, hidden: tuple = ()):
+        """
+        Aggregation stages applying a projection and replacing '_id' by a string 'id' on the server.
+
+        :param projection: (Optional) An inclusion or exclusion projection.
+        :param hidden: (Optional) Fields added by earlier stages to drop when the projection doesn't include them.
+        :return: A list of aggregation stages.
+        """
+        if projection and any(projection.values()):
+            return [{"$project": {**projection, "id": {"$toString": "$_id"}, "_id": 0}}]
+
+        exclusion = {**(projection or {}), "_id": 0}
+        exclusion.update({field: 0 for field in hidden})
+        return [{"$addFields": {"id": {"$toString": "$_id"}}}, {"$project": exclusion}]
+
+    @staticmethod
+    def geo_near(reference_location, radius: int):
+        """
+        Aggregation stage matching locations within a radius, nearest first.
+
+        :param reference_location: The reference location coordinates [latitude, longitude].
+        :param radius: The radius (in meters).
+        :return: A $geoNear aggregation stage.
+        """
+        return {
+            "$geoNear": {
+                "near": {
+                    "type": 'Point',
+                    "coordinates": reference_location
+                },
+                "key": "location",
+                "distanceField": "distance",
+                "maxDistance": radius,
+                "spherical": True
+            }
+        }
+
+    def find_one(self, collection_name, filter_criteria, projection=None, raw=False):
+        collection = self.get_collection(collection_name, raw)
+        pipeline = [{"$match": filter_criteria}, {"$limit": 1}, *self.project_id(projection)]
+
+        return next(collection.aggregate(pipeline), None)
+
+    def find_all(self, collection_name, filter_criteria=None, projection=None, raw=False):
+        collection = self.get_collection(collection_name, raw)
+        pipeline = [{"$match": filter_criteria or {}}, *self.project_id(projection)]
+
+        return list(collection.aggregate(pipeline))
+
+    def iter_documents(self, collection_name, filter_criteria=None, projection=None, after_id=None, batch_size=500):
+        collection = self.database[collection_name]
+        match = dict(filter_criteria or {})
+
+        if after_id is not None:
+            match["_id"] = {"$gt": ObjectId(after_id)}
+
+        pipeline = [{"$match": match}, {"$sort": {"_id": 1}}, *self.project_id(projection)]
+        yield from collection.aggregate(pipeline, batchSize=batch_size)
+
+    def insert_one(self, collection_name, document):
+        return self.database[collection_name].insert_one(document).inserted_id
+
+    def insert_many(self, collection_name, documents):
+        return self.database[collection_name].insert_many(documents).inserted_ids
+
+    def update_one(self, collection_name, filter_criteria, update, upsert=False, array_filters=None):
+        result = self.database[collection_name].update_one(
+            filter_criteria, update, upsert=upsert, array_filters=array_filters)
+        return result.modified_count, result.upserted_id
+
+    def find_one_and_update(self, collection_name, filter_criteria, update, upsert=False):
+        document = self.database[collection_name].find_one_and_update(
+            filter_criteria, update, upsert=upsert, return_document=ReturnDocument.AFTER)
+
+        if document is not None:
+            document["id"] = str(document.pop("_id"))
+        return document
+
+    def delete_one(self, collection_name, filter_criteria):
+        return self.database[collection_name].delete_one(filter_criteria).deleted_count
+
+    def bulk_write(self, collection_name, operations, ordered=True):
+        collection = self.database[collection_name]
+        write_requests = [
+            pymongo.UpdateOne(
+                operation["filter"],
+                operation["update"],
+                upsert=operation.get("upsert", False),
+                array_filters=operation.get("array_filters"))
+            for operation in operations
+        ]
+
+        try:
+            collection.bulk_write(write_requests, ordered=ordered)
+            return len(write_requests)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            logging.error(f"Error bulk_write failed. {write_errors[:1]}")
+
+            if ordered and write_errors:
+                return write_errors[0]["index"]
+            return len(operations) - len(write_errors)
+
+    def create_index(self, collection_name, keys, **kwargs):
+        return self.database[collection_name].create_index(keys, **kwargs)
+
+    def drop_index(self, collection_name, keys):
+        collection = self.database[collection_name]
+
+        for index in collection.list_indexes():
+            if list(index["key"].items()) == list(keys):
+                collection.drop_index(index["name"])
+                return True
+        return False
+
+    def find_nearby_locations(self, collection_name, reference_location, radius, projection=None, raw=False,
+                              limit=0):
+        collection = self.get_collection(collection_name, raw)
+        pipeline = [self.geo_near(reference_location, radius)]
+
+        if limit:
+            pipeline.append({"$limit": limit})
+
+        pipeline.extend(self.project_id(projection, hidden=("distance",)))
+        return list(collection.aggregate(pipeline))
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,757 @@
+"""
+Embedded SQLite storage backend for single node deployments and local benchmarking.
+
+Each collection is a table of JSON documents keyed by an integer row ID. create_index builds
+SQLite expression indexes on the indexed JSON fields, and equality filters on those fields are
+pushed down to SQL so lookups by natural key (list_id, placeId) are index seeks. A 2dsphere index
+becomes an R*Tree virtual table holding each document's point, kept in sync on every write, and
+nearby queries scan its bounding box and order by great-circle distance.
+Filters, updates and projections use the subset of MongoDB's syntax lib_db relies on.
+
+Points are GeoJSON [x, y] pairs, the first coordinate being the longitude like in MongoDB's 2dsphere
+indexes, so both backends return the same nearby locations for the same stored documents.
+
+Documents are decoded from JSON into plain dicts, so the 'raw' option of finds has no effect here.
+
+Connection strings follow SQLAlchemy: sqlite:///relative.db, sqlite:////absolute.db, or sqlite://
+for a private in-memory database.
+"""
+import json
+import math
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+from .base import Backend
+
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = 111320
+
+INDEXES = "_lib_db_indexes"
+
+# Natural key and geo indexes created with the database, as (keys, options)
+DEFAULT_INDEXES = {
+    "lists": [([("list_id", 1)], {})],
+    "locations": [([("placeId", 1)], {}), ([("location", "2dsphere")], {})],
+    "jobs": [([("job_id", 1)], {"unique": True})],
+}
+
+UPDATE_ERRORS = (ValueError, TypeError, KeyError, IndexError)
+
+
+def quote(name: str):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def json_path(field: str):
+    """
+    SQL literal of the JSON path of a dotted field, inlined so queries match expression indexes.
+    """
+    path = "$" + "".join('."' + part.replace('"', '\\"') + '"' for part in field.split("."))
+    return "'" + path.replace("'", "''") + "'"
+
+
+def dumps(document: dict):
+    return json.dumps(document, separators=(",", ":"))
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float):
+    """
+    Great-circle distance in meters between two points.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+# Queries
+
+def values_at(value, parts: list):
+    """
+    Values at a dotted path, traversing arrays of documents like MongoDB does.
+    """
+    if not parts:
+        return [value]
+
+    if isinstance(value, list):
+        if parts[0].isdigit():
+            index = int(parts[0])
+            return values_at(value[index], parts[1:]) if index < len(value) else []
+        return [found for element in value if isinstance(element, dict) for found in values_at(element, parts)]
+
+    if isinstance(value, dict) and parts[0] in value:
+        return values_at(value[parts[0]], parts[1:])
+    return []
+
+
+def compare(values: list, operator: str, operand):
+    try:
+        if operator == "$eq":
+            return any(v == operand or (isinstance(v, list) and operand in v) for v in values)
+        if operator == "$ne":
+            return not compare(values, "$eq", operand)
+        if operator == "$in":
+            return any(compare(values, "$eq", o) for o in operand)
+        if operator == "$nin":
+            return not compare(values, "$in", operand)
+        if operator == "$exists":
+            return bool(values) == bool(operand)
+        if operator == "$gt":
+            return any(v > operand for v in values)
+        if operator == "$gte":
+            return any(v >= operand for v in values)
+        if operator == "$lt":
+            return any(v < operand for v in values)
+        if operator == "$lte":
+            return any(v <= operand for v in values)
+    except TypeError:
+        return False
+
+    raise ValueError(f"Unsupported query operator {operator}")
+
+
+def is_operator_dict(condition):
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+
+def matches_condition(values: list, condition):
+    if is_operator_dict(condition):
+        return all(compare(values, operator, operand) for operator, operand in condition.items())
+    return compare(values, "$eq", condition)
+
+
+def matches(document, filter_criteria: dict):
+    """
+    Check a document against a filter of dotted field conditions, $and, $or and $nor.
+    """
+    for key, condition in (filter_criteria or {}).items():
+        if key == "$and":
+            if not all(matches(document, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, c) for c in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, c) for c in condition):
+                return False
+        elif not matches_condition(values_at(document, key.split(".")), condition):
+            return False
+    return True
+
+
+def matches_element(element, conditions: dict):
+    """
+    Check an array element against conditions keyed by path within the element, '' being the element itself.
+    """
+    for path, condition in conditions.items():
+        values = [element] if not path else values_at(element, path.split("."))
+        if not matches_condition(values, condition):
+            return False
+    return True
+
+
+# Updates
+
+class Update:
+    """ Applies a MongoDB style update to a document in place """
+
+    def __init__(self, document: dict, filter_criteria: dict, array_filters: list = None):
+        self.document = document
+        self.filter_criteria = filter_criteria or {}
+        self.array_filters = array_filters or []
+
+    def position(self, array_path: list):
+        """
+        Index of the first array element matched by the filter, for the positional '$' operator.
+        """
+        prefix = ".".join(array_path) + "."
+        conditions = {key[len(prefix):]: c for key, c in self.filter_criteria.items() if key.startswith(prefix)}
+        array = values_at(self.document, array_path)
+
+        if conditions and array and isinstance(array[0], list):
+            for index, element in enumerate(array[0]):
+                if matches_element(element, conditions):
+                    return index
+
+        raise ValueError("The positional operator did not find the match needed from the query")
+
+    def identified(self, array: list, identifier: str):
+        """
+        Indexes of the array elements matched by the array filters of an identifier.
+        """
+        conditions = {}
+        for array_filter in self.array_filters:
+            for key, condition in array_filter.items():
+                head, _, rest = key.partition(".")
+                if head == identifier:
+                    conditions[rest] = condition
+
+        if not conditions:
+            raise ValueError(f"No array filter found for identifier {identifier}")
+        return [index for index, element in enumerate(array) if matches_element(element, conditions)]
+
+    def targets(self, node, parts: list, path: list = ()):
+        """
+        The (container, key) pairs addressed by an update path, creating missing documents on the way.
+        """
+        part, rest = parts[0], parts[1:]
+
+        if isinstance(node, list):
+            if part == "$":
+                keys = [self.position(list(path))]
+            elif part == "$[]":
+                keys = list(range(len(node)))
+            elif part.startswith("$[") and part.endswith("]"):
+                keys = self.identified(node, part[2:-1])
+            elif part.isdigit():
+                keys = [int(part)]
+                node.extend([None] * (keys[0] + 1 - len(node)))
+            else:
+                raise ValueError(f"Cannot create field '{part}' in an array")
+        elif isinstance(node, dict):
+            keys = [part]
+        else:
+            raise ValueError(f"Cannot create field '{part}' in element {node!r}")
+
+        for key in keys:
+            if not rest:
+                yield node, key
+                continue
+
+            if isinstance(node, dict) and node.get(key) is None:
+                node[key] = {}
+            yield from self.targets(node[key], rest, [*path, part])
+
+    def apply(self, update: dict):
+        for operator, fields in update.items():
+            for field, value in fields.items():
+                for container, key in list(self.targets(self.document, field.split("."))):
+                    self.apply_operator(operator, container, key, value)
+        return self.document
+
+    @staticmethod
+    def apply_operator(operator: str, container, key, value):
+        exists = key in container if isinstance(container, dict) else key < len(container)
+        current = container[key] if exists else None
+
+        if operator == "$set":
+            container[key] = value
+        elif operator == "$unset":
+            if isinstance(container, dict):
+                container.pop(key, None)
+            elif exists:
+                container[key] = None
+        elif operator == "$inc":
+            container[key] = (current or 0) + value
+        elif operator in ("$push", "$addToSet", "$pull"):
+            if current is None:
+                current = container[key] = []
+            if not isinstance(current, list):
+                raise ValueError(f"Cannot apply {operator} to a non-array field")
+
+            if operator == "$pull":
+                container[key] = [element for element in current if not Update.pulls(element, value)]
+                return
+
+            each = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+            for element in each:
+                if operator == "$push" or element not in current:
+                    current.append(element)
+        else:
+            raise ValueError(f"Unsupported update operator {operator}")
+
+    @staticmethod
+    def pulls(element, condition):
+        if is_operator_dict(condition):
+            return matches_condition([element], condition)
+        if isinstance(condition, dict) and isinstance(element, dict):
+            return matches(element, condition)
+        return element == condition
+
+
+def upsert_document(filter_criteria: dict):
+    """
+    The document inserted by an upsert, seeded with the filter's equality conditions.
+    """
+    document = {}
+
+    for key, condition in filter_criteria.items():
+        if key.startswith("$") or is_operator_dict(condition):
+            continue
+
+        *parents, field = key.split(".")
+        node = document
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[field] = condition
+
+    return document
+
+
+# Projections
+
+def include(source: dict, target: dict, parts: list):
+    key, rest = parts[0], parts[1:]
+    if key not in source:
+        return
+
+    value = source[key]
+    if not rest:
+        target[key] = value
+    elif isinstance(value, dict):
+        include(value, target.setdefault(key, {}), rest)
+    elif isinstance(value, list):
+        elements = [element for element in value if isinstance(element, dict)]
+        for element, projected in zip(elements, target.setdefault(key, [{} for _ in elements])):
+            include(element, projected, rest)
+
+
+def exclude(source: dict, parts: list):
+    key, rest = parts[0], parts[1:]
+    if key not in source:
+        return
+
+    if not rest:
+        source.pop(key)
+    elif isinstance(source[key], dict):
+        exclude(source[key], rest)
+    elif isinstance(source[key], list):
+        for element in source[key]:
+            if isinstance(element, dict):
+                exclude(element, rest)
+
+
+def project(document: dict, projection: dict = None):
+    """
+    Apply an inclusion or exclusion projection, ignoring '_id' and 'id' which are always returned.
+    """
+    fields = [field for field in (projection or {}) if field not in ("_id", "id")]
+
+    if projection and any(projection.values()):
+        projected = {}
+        for field in fields:
+            if projection[field]:
+                include(document, projected, field.split("."))
+        return projected
+
+    for field in fields:
+        exclude(document, field.split("."))
+    return document
+
+
+def point(document: dict, field: str):
+    """
+    The (latitude, longitude) of a GeoJSON point or legacy coordinate pair field, or None.
+
+    Coordinates are read as [longitude, latitude] like MongoDB does.
+    """
+    value = document
+    for part in field.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+
+    if isinstance(value, dict):
+        value = value.get("coordinates")
+
+    try:
+        return float(value[1]), float(value[0])
+    except (TypeError, ValueError, IndexError, KeyError):
+        return None
+
+
+class SQLiteBackend(Backend):
+    """
+    SQLite storage backend in WAL mode, with one connection per thread.
+
+    Readers never block on the single writer, and writes run in IMMEDIATE transactions waiting up
+    to the timeout for the write lock, so gunicorn workers can share a database file.
+    An in-memory database has a single connection and serializes all access to it instead.
+    """
+
+    def __init__(self, connection_string, database_name, timeout: float = 30):
+        path = connection_string[len("sqlite:///"):] if connection_string.startswith("sqlite:///") else ""
+
+        self.memory = path in ("", ":memory:")
+        self.path = ":memory:" if self.memory else path
+        self.timeout = timeout
+
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.access = threading.RLock() if self.memory else nullcontext()
+        self.shared_connection = None
+        self.connections = []
+        self.schema_version = None
+        self.collections = set()
+        self.indexes = {}
+
+        with self.transaction() as connection:
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {INDEXES} "
+                               "(collection TEXT, name TEXT, keys TEXT, PRIMARY KEY (collection, name))")
+
+        for collection_name, indexes in DEFAULT_INDEXES.items():
+            for keys, options in indexes:
+                self.create_index(collection_name, keys, **options)
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        if not self.memory:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        connection.create_function("distance", 4, haversine, deterministic=True)
+
+        with self.lock:
+            self.connections.append(connection)
+        return connection
+
+    def connection(self):
+        # Every connection to ':memory:' opens a new database, so memory mode shares one
+        if self.memory:
+            if self.shared_connection is None:
+                self.shared_connection = self.connect()
+            return self.shared_connection
+
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = self.connect()
+        return connection
+
+    def refresh(self, connection):
+        """
+        Reload the collections and indexes when the schema changed, e.g. in another worker process.
+        """
+        version = connection.execute("PRAGMA schema_version").fetchone()[0]
+        if version == self.schema_version:
+            return
+
+        with self.lock:
+            tables = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+            self.collections = {name for name, in tables}
+
+            self.indexes = {}
+            if INDEXES in self.collections:
+                for collection_name, name, keys in connection.execute(f"SELECT * FROM {INDEXES}"):
+                    self.indexes.setdefault(collection_name, {})[name] = [tuple(key) for key in json.loads(keys)]
+
+            self.schema_version = version
+
+    @contextmanager
+    def transaction(self):
+        with self.access:
+            connection = self.connection()
+            connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                self.refresh(connection)
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            else:
+                connection.execute("COMMIT")
+
+    @contextmanager
+    def reading(self):
+        with self.access:
+            connection = self.connection()
+            self.refresh(connection)
+            yield connection
+
+    # Schema
+
+    def ensure_collection(self, connection, collection_name: str):
+        if collection_name in self.collections:
+            return
+
+        connection.execute(f"CREATE TABLE IF NOT EXISTS {quote(collection_name)} "
+                           "(id INTEGER PRIMARY KEY, doc TEXT NOT NULL)")
+        self.refresh(connection)
+
+    def geo_field(self, collection_name: str):
+        for keys in self.indexes.get(collection_name, {}).values():
+            if keys[0][1] == "2dsphere":
+                return keys[0][0]
+        return None
+
+    @staticmethod
+    def rtree(collection_name: str):
+        return quote(collection_name + "__rtree")
+
+    def indexed_fields(self, collection_name: str):
+        return {keys[0][0] for keys in self.indexes.get(collection_name, {}).values()
+                if len(keys) == 1 and keys[0][1] in (1, -1)}
+
+    # Rows
+
+    def where(self, collection_name: str, filter_criteria: dict):
+        """
+        SQL conditions for the equality filters on indexed fields, which are expected to hold scalars.
+        """
+        clauses, parameters = [], []
+
+        for field in self.indexed_fields(collection_name):
+            value = (filter_criteria or {}).get(field)
+            if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+                clauses.append(f"json_extract(doc, {json_path(field)}) = ?")
+                parameters.append(value)
+
+        return clauses, parameters
+
+    def select(self, connection, collection_name: str, filter_criteria: dict = None, after_id: int = None,
+               limit: int = None):
+        """
+        Fetch matching (row ID, document) pairs in row ID order.
+        """
+        if collection_name not in self.collections:
+            return []
+
+        clauses, parameters = self.where(collection_name, filter_criteria)
+        if after_id is not None:
+            clauses.append("id > ?")
+            parameters.append(after_id)
+
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        cursor = connection.execute(f"SELECT id, doc FROM {quote(collection_name)}{where} ORDER BY id", parameters)
+
+        rows = []
+        for row_id, doc in cursor:
+            document = json.loads(doc)
+            if matches(document, filter_criteria):
+                rows.append((row_id, document))
+                if limit and len(rows) >= limit:
+                    break
+
+        cursor.close()
+        return rows
+
+    @staticmethod
+    def output(row_id: int, document: dict, projection: dict = None):
+        document = project(document, projection)
+        document.pop("_id", None)
+        document["id"] = str(row_id)
+        return document
+
+    def index_point(self, connection, collection_name: str, row_id: int, document: dict = None):
+        """
+        Keep the R*Tree entry of a document in sync with its geo field.
+        """
+        field = self.geo_field(collection_name)
+        if field is None:
+            return
+
+        connection.execute(f"DELETE FROM {self.rtree(collection_name)} WHERE id = ?", (row_id,))
+
+        coordinates = point(document, field) if document is not None else None
+        if coordinates is not None:
+            latitude, longitude = coordinates
+            connection.execute(f"INSERT INTO {self.rtree(collection_name)} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (row_id, latitude, latitude, longitude, longitude, latitude, longitude))
+
+    def insert(self, connection, collection_name: str, document: dict):
+        document = {key: value for key, value in document.items() if key not in ("_id", "id")}
+        row_id = connection.execute(f"INSERT INTO {quote(collection_name)} (doc) VALUES (?)",
+                                    (dumps(document),)).lastrowid
+        self.index_point(connection, collection_name, row_id, document)
+        return str(row_id)
+
+    def update(self, connection, collection_name: str, filter_criteria: dict, update: dict, upsert: bool = False,
+               array_filters: list = None):
+        """
+        Update the first matching document.
+
+        :return: A (modified count, upserted ID, row ID, updated document) tuple, the last two None if none matched.
+        """
+        rows = self.select(connection, collection_name, filter_criteria, limit=1)
+
+        if not rows:
+            if not upsert:
+                return 0, None, None, None
+            document = Update(upsert_document(filter_criteria), filter_criteria, array_filters).apply(update)
+            upserted_id = self.insert(connection, collection_name, document)
+            return 0, upserted_id, int(upserted_id), document
+
+        row_id, document = rows[0]
+        before = dumps(document)
+        after = dumps(Update(document, filter_criteria, array_filters).apply(update))
+
+        if after == before:
+            return 0, None, row_id, document
+
+        connection.execute(f"UPDATE {quote(collection_name)} SET doc = ? WHERE id = ?", (after, row_id))
+        self.index_point(connection, collection_name, row_id, document)
+        return 1, None, row_id, document
+
+    # Backend
+
+    def find_one(self, collection_name, filter_criteria, projection=None, raw=False):
+        with self.reading() as connection:
+            rows = self.select(connection, collection_name, filter_criteria, limit=1)
+        return self.output(*rows[0], projection) if rows else None
+
+    def find_all(self, collection_name, filter_criteria=None, projection=None, raw=False):
+        with self.reading() as connection:
+            rows = self.select(connection, collection_name, filter_criteria)
+        return [self.output(row_id, document, projection) for row_id, document in rows]
+
+    def iter_documents(self, collection_name, filter_criteria=None, projection=None, after_id=None, batch_size=500):
+        # Page by row ID instead of holding a cursor open, so the caller can write between batches
+        last_id = int(after_id) if after_id is not None else 0
+
+        while True:
+            with self.reading() as connection:
+                if collection_name not in self.collections:
+                    return
+
+                clauses, parameters = self.where(collection_name, filter_criteria)
+                rows = connection.execute(
+                    f"SELECT id, doc FROM {quote(collection_name)} WHERE {' AND '.join(['id > ?', *clauses])} "
+                    f"ORDER BY id LIMIT ?", [last_id, *parameters, batch_size]).fetchall()
+
+            for row_id, doc in rows:
+                document = json.loads(doc)
+                if matches(document, filter_criteria):
+                    yield self.output(row_id, document, projection)
+
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def insert_one(self, collection_name, document):
+        with self.transaction() as connection:
+            self.ensure_collection(connection, collection_name)
+            return self.insert(connection, collection_name, document)
+
+    def insert_many(self, collection_name, documents):
+        with self.transaction() as connection:
+            self.ensure_collection(connection, collection_name)
+            return [self.insert(connection, collection_name, document) for document in documents]
+
+    def update_one(self, collection_name, filter_criteria, update, upsert=False, array_filters=None):
+        with self.transaction() as connection:
+            self.ensure_collection(connection, collection_name)
+            modified_count, upserted_id, _, _ = self.update(
+                connection, collection_name, filter_criteria, update, upsert, array_filters)
+            return modified_count, upserted_id
+
+    def find_one_and_update(self, collection_name, filter_criteria, update, upsert=False):
+        with self.transaction() as connection:
+            self.ensure_collection(connection, collection_name)
+            _, _, row_id, document = self.update(connection, collection_name, filter_criteria, update, upsert)
+            return self.output(row_id, document) if document is not None else None
+
+    def delete_one(self, collection_name, filter_criteria):
+        with self.transaction() as connection:
+            rows = self.select(connection, collection_name, filter_criteria, limit=1)
+            if not rows:
+                return 0
+
+            connection.execute(f"DELETE FROM {quote(collection_name)} WHERE id = ?", (rows[0][0],))
+            self.index_point(connection, collection_name, rows[0][0])
+            return 1
+
+    def bulk_write(self, collection_name, operations, ordered=True):
+        applied = 0
+        errors = []
+
+        # A single transaction for the batch, failed operations are skipped without writing
+        with self.transaction() as connection:
+            self.ensure_collection(connection, collection_name)
+
+            for index, operation in enumerate(operations):
+                try:
+                    self.update(connection, collection_name, operation["filter"], operation["update"],
+                                operation.get("upsert", False), operation.get("array_filters"))
+                    applied += 1
+                except UPDATE_ERRORS as e:
+                    errors.append({"index": index, "errmsg": str(e)})
+                    if ordered:
+                        break
+
+        if errors:
+            logging.error(f"Error bulk_write failed. {errors[:1]}")
+        return applied
+
+    def create_index(self, collection_name, keys, **kwargs):
+        keys = [(field, direction) for field, direction in keys]
+        name = kwargs.get("name") or "_".join(f"{field}_{direction}" for field, direction in keys)
+
+        with self.transaction() as connection:
+            self.ensure_collection(connection, collection_name)
+
+            if name in self.indexes.get(collection_name, {}):
+                return name
+
+            if any(direction == "2dsphere" for _, direction in keys):
+                if len(keys) != 1 or self.geo_field(collection_name):
+                    raise ValueError("Only a single 2dsphere index on one field is supported")
+
+                connection.execute(f"CREATE VIRTUAL TABLE {self.rtree(collection_name)} "
+                                   "USING rtree(id, min_lat, max_lat, min_lng, max_lng, +lat, +lng)")
+            else:
+                columns = ", ".join(f"json_extract(doc, {json_path(field)}){' DESC' if direction == -1 else ''}"
+                                    for field, direction in keys)
+                unique = "UNIQUE " if kwargs.get("unique") else ""
+                connection.execute(f"CREATE {unique}INDEX {quote(collection_name + '.' + name)} "
+                                   f"ON {quote(collection_name)} ({columns})")
+
+            connection.execute(f"INSERT INTO {INDEXES} VALUES (?, ?, ?)", (collection_name, name, json.dumps(keys)))
+            self.refresh(connection)
+
+            # Index the points of existing documents
+            if self.geo_field(collection_name):
+                for row_id, doc in connection.execute(f"SELECT id, doc FROM {quote(collection_name)}").fetchall():
+                    self.index_point(connection, collection_name, row_id, json.loads(doc))
+
+        return name
+
+    def drop_index(self, collection_name, keys):
+        keys = [(field, direction) for field, direction in keys]
+
+        with self.transaction() as connection:
+            for name, index_keys in self.indexes.get(collection_name, {}).items():
+                if index_keys != keys:
+                    continue
+
+                if keys[0][1] == "2dsphere":
+                    connection.execute(f"DROP TABLE {self.rtree(collection_name)}")
+                else:
+                    connection.execute(f"DROP INDEX {quote(collection_name + '.' + name)}")
+
+                connection.execute(f"DELETE FROM {INDEXES} WHERE collection = ? AND name = ?", (collection_name, name))
+                self.refresh(connection)
+                return True
+
+        return False
+
+    def find_nearby_locations(self, collection_name, reference_location, radius, projection=None, raw=False,
+                              limit=0):
+        # [x, y] like MongoDB's $geoNear, matching how point() reads stored coordinates
+        latitude, longitude = float(reference_location[1]), float(reference_location[0])
+        lat_delta = radius / METERS_PER_DEGREE
+        cos_latitude = math.cos(math.radians(latitude))
+        lng_delta = radius / (METERS_PER_DEGREE * cos_latitude) if cos_latitude > 1e-9 else 360
+
+        # Scan every longitude when the box wraps around the antimeridian
+        min_lng, max_lng = longitude - lng_delta, longitude + lng_delta
+        if min_lng < -180 or max_lng > 180:
+            min_lng, max_lng = -180, 180
+
+        with self.reading() as connection:
+            if self.geo_field(collection_name) is None:
+                raise ValueError(f"Unable to find a 2dsphere index for the nearby query on {collection_name}")
+
+            rows = connection.execute(
+                f"SELECT t.id, t.doc, distance(r.lat, r.lng, ?, ?) AS d "
+                f"FROM {self.rtree(collection_name)} r JOIN {quote(collection_name)} t ON t.id = r.id "
+                f"WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lng >= ? AND r.min_lng <= ? "
+                f"AND distance(r.lat, r.lng, ?, ?) <= ? ORDER BY d LIMIT ?",
+                (latitude, longitude, latitude - lat_delta, latitude + lat_delta, min_lng, max_lng,
+                 latitude, longitude, radius, limit or -1)).fetchall()
+
+        return [self.output(row_id, json.loads(doc), projection) for row_id, doc, _ in rows]
+
+    def close(self):
+        with self.access, self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+            self.shared_connection = None
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+from .db import DatabaseInterface
+
+
+class PendingWrite:
+    """ A list mutation waiting for the next flush, with the future its caller awaits """
+
+    def __init__(self, kind: str, list_id: str, future: asyncio.Future, item: dict = None,
+                 criteria: str = None, item_id: str = None):
+        self.kind = kind
+        self.list_id = list_id
+        self.future = future
+        self.item = item
+        self.criteria = criteria
+        self.item_id = item_id
+
+
+class CoalescedWrite:
+    """ A single update operation standing in for one or more pending writes on a list """
+
+    def __init__(self, kind: str, list_id: str):
+        self.kind = kind
+        self.list_id = list_id
+        self.writes = []
+
+    def operation(self):
+        write = self.writes[-1]
+
+        if self.kind == "push":
+            return DatabaseInterface.push_items_operation(self.list_id, [w.item for w in self.writes])
+        if self.kind == "pull":
+            return DatabaseInterface.pull_items_operation(self.list_id, write.criteria)
+        return DatabaseInterface.update_item_operation(self.list_id, write.item_id, write.item)
+
+
+def coalesce(writes: list):
+    """
+    Collapse pending list mutations into as few update operations as possible, preserving per-list order.
+
+    - Consecutive adds to the same list are merged into one $push with $each.
+    - Adds directly followed by a remove of the same item name on the same list are dropped,
+      since the remove pulls them anyway.
+
+    :param writes: The pending writes in arrival order.
+    :return: A list of CoalescedWrite, each holding the pending writes it resolves.
+    """
+    coalesced = []
+    last_by_list = {}
+
+    for write in writes:
+        last = last_by_list.get(write.list_id)
+
+        if write.kind == "push" and last is not None and last.kind == "push":
+            last.writes.append(write)
+            continue
+
+        current = CoalescedWrite(write.kind, write.list_id)
+
+        if write.kind == "pull" and last is not None and last.kind == "push":
+            removed = [w for w in last.writes if w.item.get("item") == write.criteria]
+            last.writes = [w for w in last.writes if w.item.get("item") != write.criteria]
+            current.writes.extend(removed)
+
+        current.writes.append(write)
+        coalesced.append(current)
+        last_by_list[write.list_id] = current
+
+    return [c for c in coalesced if c.kind != "push" or c.writes]
+
+
+class WriteBatcher:
+    """
+    Coalesces list mutations arriving within a short window into a single ordered bulk_write.
+
+    Mutations mirror the DatabaseInterface list methods, but are awaited. Each caller's future
+    resolves to 1 once the operation standing in for its mutation is applied, or None if it failed.
+    A failed operation doesn't hold back the operations after it.
+    Flushes run one at a time so mutations on a list are applied in arrival order.
+    """
+
+    def __init__(self, db: DatabaseInterface, collection_name: str = "lists", window: float = 0.005,
+                 max_batch: int = 500):
+        self.db = db
+        self.collection_name = collection_name
+        self.window = window
+        self.max_batch = max_batch
+
+        self.pending = []
+        self.timer = None
+        self.flushes = set()
+        self.flush_lock = None
+
+    async def push_to_items_list(self, list_id: str, item: dict):
+        """
+        Add an item to the 'items' list of a list.
+        """
+        return await self.submit("push", list_id, item=item)
+
+    async def remove_from_items_list(self, list_id: str, criteria: str):
+        """
+        Remove items matching the criteria (item name) from the 'items' list of a list.
+        """
+        return await self.submit("pull", list_id, criteria=criteria)
+
+    async def update_item_in_list(self, list_id: str, item_id: str, new_item: dict):
+        """
+        Update an item within the 'items' list of a list.
+        """
+        return await self.submit("set", list_id, item=new_item, item_id=item_id)
+
+    def submit(self, kind: str, list_id: str, **kwargs):
+        loop = asyncio.get_running_loop()
+
+        if self.flush_lock is None:
+            self.flush_lock = asyncio.Lock()
+
+        write = PendingWrite(kind, list_id, loop.create_future(), **kwargs)
+        self.pending.append(write)
+
+        if len(self.pending) >= self.max_batch:
+            self.start_flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.start_flush)
+
+        return write.future
+
+    def start_flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        task = asyncio.ensure_future(self.flush())
+        self.flushes.add(task)
+        task.add_done_callback(self.flushes.discard)
+
+    async def flush(self):
+        """
+        Write everything pending with ordered bulk_writes and resolve the callers' futures.
+        """
+        async with self.flush_lock:
+            writes, self.pending = self.pending, []
+            if not writes:
+                return
+
+            coalesced = coalesce(writes)
+            remaining = coalesced
+            loop = asyncio.get_running_loop()
+
+            # An ordered bulk_write stops at the first failed operation, so resubmit the operations after it.
+            # Only the mutations behind the failed operation fail, like separate update_one calls would.
+            while remaining:
+                operations = [c.operation() for c in remaining]
+
+                try:
+                    applied = await loop.run_in_executor(
+                        None, self.db.bulk_write, self.collection_name, operations, True)
+                except Exception as e:
+                    logging.error(f"Error write batch failed. {e}")
+                    applied = None
+
+                if applied is None:
+                    self.resolve(remaining, None)
+                    break
+
+                self.resolve(remaining[:applied], 1)
+                self.resolve(remaining[applied:applied + 1], None)
+                remaining = remaining[applied + 1:]
+
+            logging.debug(f"Flushed {len(writes)} list writes as {len(coalesced)} operations")
+
+    @staticmethod
+    def resolve(coalesced: list, result):
+        for c in coalesced:
+            for write in c.writes:
+                if not write.future.done():
+                    write.future.set_result(result)
+
+    async def close(self):
+        """
+        Flush pending writes and wait for in-flight flushes to finish.
+        """
+        if self.pending:
+            self.start_flush()
+        if self.flushes:
+            await asyncio.gather(*self.flushes)
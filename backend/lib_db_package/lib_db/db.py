@@ -1,7 +1,7 @@
 import logging
-import pymongo
 import requests
 import os
+from .backends import open_backend
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -10,85 +10,132 @@ logging.basicConfig(
 
 places_api_key = os.environ.get('API_KEY', "")
 
+# Location types stored in the locations collection
+STORE_TYPES = [
+    "atm",
+    "bakery",
+    "bank",
+    "bar",
+    "beauty_salon",
+    "bicycle_store",
+    "book_store",
+    "cafe",
+    "car_rental",
+    "car_repair",
+    "car_wash",
+    "clothing_store",
+    "convenience_store",
+    "department_store",
+    "drugstore",
+    "electronics_store",
+    "florist",
+    "furniture_store",
+    "gas_station",
+    "hair_care",
+    "hardware_store",
+    "home_goods_store",
+    "jewelry_store",
+    "liquor_store",
+    "pet_store",
+    "pharmacy",
+    "shoe_store",
+    "shopping_mall",
+    "store",
+    "grocery_or_supermarket"
+]
+
+# Location fields used to build nearby item results
+NEARBY_LOCATION_PROJECTION = {"name": 1, "vicinity": 1, "placeId": 1, "location.coordinates": 1, "types": 1}
+
+# List item fields used to match items against nearby locations
+NEARBY_ITEM_PROJECTION = {"items.item": 1, "items.tag": 1, "items.id": 1}
 
 
 class DatabaseInterface:
-    """ Interface for MongoDB database for Location List application servers """
+    """ Interface for the Location List application servers' database, on MongoDB or embedded SQLite """
 
-    # "mongodb://172.17.0.1:27017/", "appDb"
+    # "mongodb://172.17.0.1:27017/", "appDb" or "sqlite:////data/app.db", "appDb"
     def __init__(self, connection_string, database_name):
-        self.client = pymongo.MongoClient(connection_string)
-        self.database = self.client[database_name]
+        self.backend = open_backend(connection_string, database_name)
 
     def get_database(self):
         """
         Returns the client for the given database.
-        :return: The database client
+        :return: The database client, or None if the backend isn't MongoDB
         """
-        return self.database
+        return getattr(self.backend, "database", None)
 
     def get_client(self):
         """
         Returns the client for the given mongo database.
-        :return: The client
+        :return: The client, or None if the backend isn't MongoDB
         """
-        return self.client
+        return getattr(self.backend, "client", None)
+
+    def close(self):
+        """
+        Close the backend's connections.
+        """
+        self.backend.close()
 
     # Generic DB methods
 
-    def find_one(self, collection_name: str, filter_criteria: dict):
+    def find_one(self, collection_name: str, filter_criteria: dict, projection: dict = None, raw: bool = False):
         """
         Find a single document in the specified collection based on the provided filter criteria.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param filter_criteria: A dictionary specifying the filter criteria.
-        :return: The found document with '_id' replaced by 'id', or None if an error occurs.
+        :param projection: (Optional) A dictionary specifying the fields to return.
+        :param raw: (Optional) Return the document as a RawBSONDocument on MongoDB.
+        :return: The found document with '_id' replaced by 'id', or None if not found or an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-            document = collection.find_one(filter_criteria)
-
-            if not document:
-                document["id"] = str(document["_id"])
-                del document["_id"]
-
-            return document
+            return self.backend.find_one(collection_name, filter_criteria, projection, raw)
         except Exception as e:
             logging.error(f"Error find failed. {e}")
             return None
 
-    def find_all(self, collection_name: str, filter_criteria: dict = None):
+    def find_all(self, collection_name: str, filter_criteria: dict = None, projection: dict = None, raw: bool = False):
         """
         Find all documents in the specified collection based on optional filter criteria.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param filter_criteria: (Optional) A dictionary specifying the filter criteria.
+        :param projection: (Optional) A dictionary specifying the fields to return.
+        :param raw: (Optional) Return documents as RawBSONDocument on MongoDB.
         :return: A list of documents with '_id' replaced by 'id', or None if an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-            docs = list(collection.find(filter_criteria)
-                        ) if filter_criteria else list(collection.find())
-            for doc in docs:
-                doc["id"] = str(doc["_id"])
-                del doc["_id"]
-            return docs
+            return self.backend.find_all(collection_name, filter_criteria, projection, raw)
         except Exception as e:
             logging.error(f"Error find_all failed. {e}")
             return None
 
+    def iter_documents(self, collection_name: str, filter_criteria: dict = None, projection: dict = None,
+                       after_id: str = None, batch_size: int = 500):
+        """
+        Stream documents in the specified collection in '_id' order with a cursor.
+
+        :param collection_name: The name of the collection.
+        :param filter_criteria: (Optional) A dictionary specifying the filter criteria.
+        :param projection: (Optional) A dictionary specifying the fields to return.
+        :param after_id: (Optional) Resume after the document with this 'id'.
+        :param batch_size: (Optional) The number of documents fetched per round trip.
+        :return: A generator of documents with '_id' replaced by 'id'.
+        """
+        return self.backend.iter_documents(collection_name, filter_criteria, projection, after_id, batch_size)
+
     def insert_one(self, collection_name: str, document: dict):
         """
         Insert a single document into the specified collection.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param document: The document to be inserted.
         :return: The inserted document ID, or None if an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-            result = collection.insert_one(document)
-            return result.inserted_id
+            return self.backend.insert_one(collection_name, document)
         except Exception as e:
             logging.error(f"Error insert_one failed. {e}")
             return None
@@ -97,14 +144,12 @@ class DatabaseInterface:
         """
         Insert multiple documents into the specified collection.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param documents: A list of documents to be inserted.
         :return: A list of inserted document IDs, or None if an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-            result = collection.insert_many(documents)
-            return result.inserted_ids
+            return self.backend.insert_many(collection_name, documents)
         except Exception as e:
             logging.error(f"Error insert many failed. {e}")
             return None
@@ -113,15 +158,14 @@ class DatabaseInterface:
         """
         Update a single document in the specified collection based on the provided filter criteria.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param filter_criteria: A dictionary specifying the filter criteria.
         :param update: A dictionary specifying the update operation.
         :return: The number of modified documents, or None if an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-            result = collection.update_one(filter_criteria, update)
-            return result.modified_count
+            modified_count, _ = self.backend.update_one(collection_name, filter_criteria, update)
+            return modified_count
         except Exception as e:
             logging.error(f"Error update_one failed. {e}")
             return None
@@ -130,53 +174,144 @@ class DatabaseInterface:
         """
         Update or insert a single document in the specified collection based on the provided filter criteria.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param filter_criteria: A dictionary specifying the filter criteria.
         :param update: A dictionary specifying the update operation.
         :return: The upserted document ID, or None if an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-            result = collection.update_one(
-                filter_criteria, {"$set": update}, upsert=True)
-            return result.upserted_id
+            _, upserted_id = self.backend.update_one(collection_name, filter_criteria, {"$set": update}, upsert=True)
+            return upserted_id
         except Exception as e:
             logging.error(f"Error upsert_one failed. {e}")
             return None
 
+    def find_one_and_update(self, collection_name: str, filter_criteria: dict, update: dict, upsert: bool = False):
+        """
+        Atomically update a single document in the specified collection and return it.
+
+        :param collection_name: The name of the collection.
+        :param filter_criteria: A dictionary specifying the filter criteria.
+        :param update: A dictionary specifying the update operation.
+        :param upsert: (Optional) Insert the document if none matches.
+        :return: The updated document with '_id' replaced by 'id', or None if none matched or an error occurs.
+        """
+        try:
+            return self.backend.find_one_and_update(collection_name, filter_criteria, update, upsert)
+        except Exception as e:
+            logging.error(f"Error find_one_and_update failed. {e}")
+            return None
+
     def delete_one(self, collection_name: str, filter_criteria: dict):
         """
         Delete a single document from the specified collection based on the provided filter criteria.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param filter_criteria: A dictionary specifying the filter criteria.
         :return: The number of deleted documents, or None if an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-            result = collection.delete_one(filter_criteria)
-            return result.deleted_count
+            return self.backend.delete_one(collection_name, filter_criteria)
         except Exception as e:
             logging.error(f"Error delete_one failed. {e}")
             return None
 
+    def create_index(self, collection_name: str, keys: list, **kwargs):
+        """
+        Create an index on the specified collection if it doesn't exist.
+
+        :param collection_name: The name of the collection.
+        :param keys: A list of (field, direction or index type) tuples.
+        :return: The index name, or None if an error occurs.
+        """
+        try:
+            return self.backend.create_index(collection_name, keys, **kwargs)
+        except Exception as e:
+            logging.error(f"Error create_index failed. {e}")
+            return None
+
+    def drop_index(self, collection_name: str, keys: list):
+        """
+        Drop an index from the specified collection if it exists.
+
+        :param collection_name: The name of the collection.
+        :param keys: The (field, direction or index type) tuples of the index.
+        :return: True if an index was dropped, otherwise False, or None if an error occurs.
+        """
+        try:
+            return self.backend.drop_index(collection_name, keys)
+        except Exception as e:
+            logging.error(f"Error drop_index failed. {e}")
+            return None
+
+    def bulk_write(self, collection_name: str, operations: list, ordered: bool = True):
+        """
+        Apply a batch of update operations to the specified collection in a single round trip.
+
+        :param collection_name: The name of the collection.
+        :param operations: A list of dicts with 'filter' and 'update', and optional 'upsert' and 'array_filters'.
+        :param ordered: (Optional) Stop at the first failed operation, applying operations in order.
+        :return: The number of operations applied before the first failure, or None if an error occurs.
+        """
+        try:
+            return self.backend.bulk_write(collection_name, operations, ordered)
+        except Exception as e:
+            logging.error(f"Error bulk_write failed. {e}")
+            return None
+
     # Specific DB methods
 
+    @staticmethod
+    def push_items_operation(list_id: str, items: list):
+        """
+        Update operation adding items to the 'items' list of a list.
+        """
+        return {"filter": {'list_id': list_id}, "update": {"$push": {"items": {"$each": items}}}}
+
+    @staticmethod
+    def pull_items_operation(list_id: str, criteria: str):
+        """
+        Update operation removing items matching the criteria (item name) from the 'items' list of a list.
+        """
+        return {"filter": {'list_id': list_id}, "update": {"$pull": {"items": {"item": criteria}}}}
+
+    @staticmethod
+    def retag_items_operation(list_id: str, tags: dict):
+        """
+        Update operation setting the tag of every item in a list by item name.
+
+        :param list_id: The ID of the list.
+        :param tags: A dict of item name to new tag.
+        """
+        return {
+            "filter": {'list_id': list_id},
+            "update": {"$set": {f"items.$[i{n}].tag": tag for n, tag in enumerate(tags.values())}},
+            "array_filters": [{f"i{n}.item": item} for n, item in enumerate(tags)]
+        }
+
+    @staticmethod
+    def update_item_operation(list_id: str, item_id: str, new_item: dict):
+        """
+        Update operation setting new values on an item in the 'items' list of a list.
+        """
+        return {
+            "filter": {'list_id': list_id, "items.id": item_id},
+            "update": {"$set": {f"items.$.{key}": value for key, value in new_item.items()}}
+        }
+
     def push_to_items_list(self, collection_name: str, list_id: str, item: dict):
         """
         Add an item to the 'items' list within a specified collection and list.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param list_id: The ID of the list.
         :param item: The item to be added to the 'items' list.
         :return: The number of modified documents, or None if an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-            update_operation = {"$push": {"items": item}}
-            result = collection.update_one(
-                {'list_id': list_id}, update_operation)
-            return result.modified_count
+            operation = self.push_items_operation(list_id, [item])
+            modified_count, _ = self.backend.update_one(collection_name, operation["filter"], operation["update"])
+            return modified_count
         except Exception as e:
             logging.error(f"Error push_to_items_list failed. {e}")
             return None
@@ -185,17 +320,15 @@ class DatabaseInterface:
         """
         Remove items from the 'items' list within a specified collection and list based on a given criteria.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param list_id: The ID of the list.
         :param criteria: The criteria for removing items (e.g., item name).
         :return: The number of modified documents, or None if an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-            update_operation = {"$pull": {"items": {"item": criteria}}}
-            result = collection.update_one(
-                {'list_id': list_id}, update_operation)
-            return result.modified_count
+            operation = self.pull_items_operation(list_id, criteria)
+            modified_count, _ = self.backend.update_one(collection_name, operation["filter"], operation["update"])
+            return modified_count
         except Exception as e:
             logging.error(f"Error remove_to_items_list failed. {e}")
             return None
@@ -204,68 +337,66 @@ class DatabaseInterface:
         """
         Update an item within the 'items' list in a specified collection and list.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param list_id: The ID of the list.
         :param item_id: The ID of the item to be updated.
         :param new_item: The new values for the item.
         :return: The number of modified documents, or None if an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-            filter_criteria = {**{'list_id': list_id}, "items.id": item_id}
-            update_operation = {
-                "$set": {f"items.$.{key}": value for key, value in new_item.items()}}
-            result = collection.update_one(filter_criteria, update_operation)
-            return result.modified_count
+            operation = self.update_item_operation(list_id, item_id, new_item)
+            modified_count, _ = self.backend.update_one(collection_name, operation["filter"], operation["update"])
+            return modified_count
         except Exception as e:
             logging.error(f"Error update_item_in_list failed. {e}")
             return None
 
-    def find_nearby_locations(self, collection_name: str, reference_location, radius: int):
+    def find_nearby_locations(self, collection_name: str, reference_location, radius: int,
+                              projection: dict = None, raw: bool = False):
         """
         Find nearby locations in a specified collection based on a reference location and radius.
 
-        :param collection_name: The name of the MongoDB collection.
+        :param collection_name: The name of the collection.
         :param reference_location: The reference location coordinates [latitude, longitude].
         :param radius: The radius (in meters) for finding nearby locations.
+        :param projection: (Optional) A dictionary specifying the fields to return.
+        :param raw: (Optional) Return locations as RawBSONDocument on MongoDB.
         :return: A list of nearby locations with '_id' replaced by 'id', or None if an error occurs.
         """
         try:
-            collection = self.database[collection_name]
-
-            query = {
-                "location": {
-                    "$near": {
-                        "$geometry": {
-                            "type": 'Point',
-                            "coordinates": reference_location
-                        },
-                        "$maxDistance": radius
-                    }
-                }
-            }
-
-            docs = list(collection.find(query))
+            docs = self.backend.find_nearby_locations(collection_name, reference_location, radius, projection, raw)
 
             if len(docs) == 0:
                 logging.info("Found no nearby locations, checking if new locations should be loaded")
-                query["location"]["$near"]["$maxDistance"] = 3000
-                locs = list(collection.find(query))
 
-                if len(locs) == 0:
+                if self.has_nearby_locations(collection_name, reference_location, 3000) is False:
                     logging.info("Loading new locations from Places API")
                     self.load_locations(reference_location[0], reference_location[1])
-                    docs = list(collection.find(query))
-
-            for doc in docs:
-                doc["id"] = str(doc["_id"])
-                del doc["_id"]
+                    docs = self.backend.find_nearby_locations(
+                        collection_name, reference_location, 3000, projection, raw)
 
             return docs
         except Exception as e:
             logging.error(f"Error find_nearby_locations failed. {e}")
             return None
 
+    def has_nearby_locations(self, collection_name: str, reference_location, radius: int):
+        """
+        Check if any location in the specified collection is within a radius of a reference location.
+
+        :param collection_name: The name of the collection.
+        :param reference_location: The reference location coordinates [latitude, longitude].
+        :param radius: The radius (in meters).
+        :return: True if a location is found within the radius, False if not, or None if an error occurs.
+        """
+        try:
+            docs = self.backend.find_nearby_locations(
+                collection_name, reference_location, radius, projection={"id": 1}, limit=1)
+            return len(docs) > 0
+        except Exception as e:
+            logging.error(f"Error has_nearby_locations failed. {e}")
+            return None
+
     def find_nearby_items(self, list_id: str, latitude: float, longitude: float, radius: int = 1000):
         """
         Find nearby items and locations by type given a point and list ID.
@@ -280,22 +411,29 @@ class DatabaseInterface:
             locations = self.find_nearby_locations(
                 "locations",
                 [latitude, longitude],
-                radius)
+                radius,
+                projection=NEARBY_LOCATION_PROJECTION,
+                raw=True)
 
-            user_list = self.find_one("lists", {"list_id": list_id})
+            user_list = self.find_one("lists", {"list_id": list_id}, projection=NEARBY_ITEM_PROJECTION, raw=True)
             items_found = []
 
+            # Index locations by type, keeping them nearest first
+            locations_by_type = {}
+            for location in locations:
+                for location_type in location["types"]:
+                    locations_by_type.setdefault(location_type, []).append(location)
+
             for item in user_list["items"]:
-                for location in locations:
-                    if item["tag"] in location["types"]:
-                        items_found.append(
-                            {"item": item["item"], "store": location["name"],
-                                "id": item["id"], "location": {
-                                    "address": location["vicinity"],
-                                    "placeId": location["placeId"],
-                                    "coords": location["location"]["coordinates"],
-                                    }}
-                        )
+                for location in locations_by_type.get(item["tag"], []):
+                    items_found.append(
+                        {"item": item["item"], "store": location["name"],
+                            "id": item["id"], "location": {
+                                "address": location["vicinity"],
+                                "placeId": location["placeId"],
+                                "coords": location["location"]["coordinates"],
+                                }}
+                    )
 
             combined_items = {}
             for item in items_found:
@@ -331,43 +469,11 @@ class DatabaseInterface:
             url = f"https://maps.googleapis.com/maps/api/place/nearbysearch/json?location={latitude}%2C{longitude}&type=store&radius=50000&key={places_api_key}"
 
             response = requests.request("GET", url)
-            store_types = [
-                "atm",
-                "bakery",
-                "bank",
-                "bar",
-                "beauty_salon",
-                "bicycle_store",
-                "book_store",
-                "cafe",
-                "car_rental",
-                "car_repair",
-                "car_wash",
-                "clothing_store",
-                "convenience_store",
-                "department_store",
-                "drugstore",
-                "electronics_store",
-                "florist",
-                "furniture_store",
-                "gas_station",
-                "hair_care",
-                "hardware_store",
-                "home_goods_store",
-                "jewelry_store",
-                "liquor_store",
-                "pet_store",
-                "pharmacy",
-                "shoe_store",
-                "shopping_mall",
-                "store",
-                "grocery_or_supermarket"
-            ]
             data = response.json()
             docs = []
 
             for doc in data["results"]:
-                if any(value in store_types for value in doc["types"]):
+                if any(value in STORE_TYPES for value in doc["types"]):
                     docs.append({
                         "types": doc["types"],
                         "name": doc["name"],
@@ -382,11 +488,17 @@ class DatabaseInterface:
                         }
                     })
 
-            logging.info(f"Found {len(data['results'])} inserted {len(docs)}")
+            logging.info(f"Found {len(data['results'])} upserting {len(docs)}")
 
             if len(docs) > 0:
-                self.insert_many("locations", docs)
-                self.database["locations"].create_index([("location", "2dsphere")])
+                # Searches around nearby points overlap, so upsert by place ID instead of inserting duplicates
+                operations = [
+                    {"filter": {"placeId": doc["placeId"]}, "update": {"$set": doc}, "upsert": True}
+                    for doc in {doc["placeId"]: doc for doc in docs}.values()
+                ]
+                self.create_index("locations", [("placeId", 1)])
+                self.bulk_write("locations", operations, ordered=False)
+                self.create_index("locations", [("location", "2dsphere")])
             return len(docs)
         
         except Exception as e:
@@ -0,0 +1,346 @@
+"""
+Bulk import store locations from an offline dataset into the locations collection.
+
+Streams GeoJSON, NDJSON/GeoJSONSeq or CSV files (optionally gzipped), maps categories
+(e.g. OSM shop/amenity tags) onto STORE_TYPES, dedupes by place ID and bulk upserts in
+parallel batches. Memory is bounded by the batches in flight and the dedupe window of
+recently seen place IDs; duplicates further apart than the window are upserted again, which
+is harmless. The 2dsphere index is dropped during the import and built once at the end, pass
+--keep-index when importing into a database serving nearby queries.
+
+Usage:
+    lib-db-import stores.geojsonseq.gz --db-host mongodb://localhost:27017 --db-name appDb
+    lib-db-import stores.geojsonseq.gz --db-host sqlite:////data/app.db
+"""
+import os
+import csv
+import gzip
+import json
+import time
+import logging
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .db import DatabaseInterface, STORE_TYPES
+
+# Optional dependency for streaming GeoJSON FeatureCollections
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+FORMATS = {
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".geojsonl": "ndjson",
+    ".geojsonseq": "ndjson",
+    ".geojson": "geojson",
+    ".json": "geojson",
+    ".csv": "csv",
+}
+
+# OSM shop/amenity tag values mapped onto STORE_TYPES
+OSM_TYPES = {
+    "supermarket": ["grocery_or_supermarket", "supermarket"],
+    "greengrocer": ["grocery_or_supermarket"],
+    "butcher": ["grocery_or_supermarket"],
+    "convenience": ["convenience_store"],
+    "bakery": ["bakery"],
+    "pharmacy": ["pharmacy"],
+    "chemist": ["drugstore"],
+    "hardware": ["hardware_store"],
+    "doityourself": ["hardware_store"],
+    "clothes": ["clothing_store"],
+    "shoes": ["shoe_store"],
+    "electronics": ["electronics_store"],
+    "mobile_phone": ["electronics_store"],
+    "computer": ["electronics_store"],
+    "furniture": ["furniture_store"],
+    "florist": ["florist"],
+    "jewelry": ["jewelry_store"],
+    "alcohol": ["liquor_store"],
+    "wine": ["liquor_store"],
+    "pet": ["pet_store"],
+    "books": ["book_store"],
+    "bicycle": ["bicycle_store"],
+    "department_store": ["department_store"],
+    "mall": ["shopping_mall"],
+    "beauty": ["beauty_salon"],
+    "cosmetics": ["beauty_salon"],
+    "hairdresser": ["hair_care"],
+    "houseware": ["home_goods_store"],
+    "household": ["home_goods_store"],
+    "interior_decoration": ["home_goods_store"],
+    "car_repair": ["car_repair"],
+    "car_wash": ["car_wash"],
+    "car_rental": ["car_rental"],
+    "fuel": ["gas_station"],
+    "cafe": ["cafe"],
+    "bar": ["bar"],
+    "pub": ["bar"],
+    "bank": ["bank"],
+    "atm": ["atm"],
+}
+
+ID_FIELDS = ["placeId", "place_id", "@id", "osm_id", "id"]
+LATITUDE_FIELDS = ["lat", "latitude"]
+LONGITUDE_FIELDS = ["lon", "lng", "longitude"]
+CATEGORY_FIELDS = ["shop", "amenity", "category", "categories", "types"]
+
+
+def detect_format(path: str):
+    """
+    Detect the file format from its extension, ignoring a trailing .gz.
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    extension = os.path.splitext(name)[1].lower()
+
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown format for {path}, pass --format")
+    return FORMATS[extension]
+
+
+def open_file(path: str, binary: bool = False):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb") if binary else gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "rb") if binary else open(path, "r", encoding="utf-8", newline="")
+
+
+def iter_records(path: str, file_format: str):
+    """
+    Stream the records of a dataset one at a time.
+
+    :param path: The dataset file path.
+    :param file_format: One of 'ndjson', 'geojson' or 'csv'.
+    :return: A generator of GeoJSON features or flat record dicts.
+    """
+    # ijson parses bytes, the other formats are read as text
+    with open_file(path, binary=file_format == "geojson") as file:
+        if file_format == "ndjson":
+            for line in file:
+                # GeoJSONSeq prefixes records with an RS character
+                line = line.strip().lstrip("\x1e")
+                if line:
+                    yield json.loads(line)
+
+        elif file_format == "geojson":
+            if ijson is None:
+                raise ImportError("Streaming GeoJSON FeatureCollections requires ijson, pip install lib_db[geojson]")
+            yield from ijson.items(file, "features.item", use_float=True)
+
+        elif file_format == "csv":
+            yield from csv.DictReader(file)
+
+        else:
+            raise ValueError(f"Unknown format {file_format}")
+
+
+def first(record: dict, fields: list):
+    for field in fields:
+        value = record.get(field)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def point(geometry: dict):
+    """
+    Reduce a GeoJSON geometry to a (longitude, latitude) point, using the vertex mean of areas.
+    """
+    coordinates = geometry.get("coordinates")
+    geometry_type = geometry.get("type")
+
+    if geometry_type == "Point":
+        return coordinates[0], coordinates[1]
+
+    if geometry_type == "Polygon":
+        ring = coordinates[0]
+    elif geometry_type == "MultiPolygon":
+        ring = coordinates[0][0]
+    elif geometry_type == "LineString":
+        ring = coordinates
+    else:
+        return None
+
+    return sum(c[0] for c in ring) / len(ring), sum(c[1] for c in ring) / len(ring)
+
+
+def map_types(properties: dict):
+    """
+    Map a record's categories onto STORE_TYPES.
+
+    :return: The store types of the record, empty if it isn't a store.
+    """
+    types = []
+
+    for field in CATEGORY_FIELDS:
+        values = properties.get(field)
+        if not values:
+            continue
+        if not isinstance(values, list):
+            values = str(values).replace(";", ",").split(",")
+
+        for value in values:
+            if value is None:
+                continue
+            value = str(value).strip().lower()
+            for store_type in OSM_TYPES.get(value, [value] if value in STORE_TYPES else []):
+                if store_type not in types:
+                    types.append(store_type)
+
+    if properties.get("shop") and "store" not in types:
+        types.append("store")
+
+    return types
+
+
+def address(properties: dict):
+    vicinity = first(properties, ["vicinity", "address", "addr:full"])
+    if vicinity:
+        return vicinity
+
+    street = " ".join(p for p in [properties.get("addr:housenumber"), properties.get("addr:street")] if p)
+    return ", ".join(p for p in [street, properties.get("addr:city")] if p)
+
+
+def to_location(record: dict):
+    """
+    Convert a dataset record into a locations document.
+
+    :param record: A GeoJSON feature or a flat record.
+    :return: The location document, or None if the record has no ID, coordinates or store type.
+    """
+    if record.get("type") == "Feature":
+        properties = dict(record.get("properties") or {})
+        properties.setdefault("id", record.get("id"))
+        coordinates = point(record.get("geometry") or {})
+    else:
+        properties = record
+        latitude, longitude = first(record, LATITUDE_FIELDS), first(record, LONGITUDE_FIELDS)
+        coordinates = (float(longitude), float(latitude)) if latitude is not None and longitude is not None else None
+
+    place_id = first(properties, ID_FIELDS)
+    types = map_types(properties)
+
+    if place_id is None or coordinates is None or not types:
+        return None
+
+    return {
+        "types": types,
+        "name": first(properties, ["name", "brand"]) or "",
+        "vicinity": address(properties),
+        "placeId": str(place_id),
+        "location": {
+            "type": "Point",
+            # Stored as [latitude, longitude] like the locations loaded from the Places API
+            "coordinates": [float(coordinates[1]), float(coordinates[0])]
+        }
+    }
+
+
+def import_locations(db: DatabaseInterface, records, batch_size: int = 1000, workers: int = 4,
+                     defer_index: bool = True, collection_name: str = "locations", dedupe_window: int = 1000000):
+    """
+    Bulk upsert store records into the locations collection.
+
+    :param db: The database interface.
+    :param records: An iterable of dataset records.
+    :param batch_size: (Optional) The number of upserts per bulk_write.
+    :param workers: (Optional) The number of batches written in parallel.
+    :param defer_index: (Optional) Drop the 2dsphere index during the import and build it once at the end,
+        set to False to keep nearby queries working while importing.
+    :param collection_name: (Optional) The name of the collection.
+    :param dedupe_window: (Optional) The number of recent place IDs remembered to skip duplicates.
+    :return: A dict of import statistics.
+    """
+    stats = {"read": 0, "skipped": 0, "duplicates": 0, "upserted": 0, "failed": 0}
+    seen = OrderedDict()
+    batch = []
+    batches = 0
+    in_flight = set()
+    start = time.time()
+
+    db.create_index(collection_name, [("placeId", 1)])
+    if defer_index:
+        db.drop_index(collection_name, [("location", "2dsphere")])
+
+    def collect(done):
+        for future in done:
+            applied, size = future.result()
+            stats["upserted"] += applied or 0
+            stats["failed"] += size - (applied or 0)
+
+    def write(operations):
+        return db.bulk_write(collection_name, operations, ordered=False), len(operations)
+
+    # Rebuild the 2dsphere index even if the import fails, nearby queries need it
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for record in records:
+                stats["read"] += 1
+
+                try:
+                    location = to_location(record)
+                except (ValueError, TypeError, KeyError, IndexError, AttributeError, ZeroDivisionError):
+                    location = None
+
+                if location is None:
+                    stats["skipped"] += 1
+                    continue
+                if location["placeId"] in seen:
+                    stats["duplicates"] += 1
+                    continue
+
+                seen[location["placeId"]] = None
+                if len(seen) > dedupe_window:
+                    seen.popitem(last=False)
+                batch.append({"filter": {"placeId": location["placeId"]}, "update": {"$set": location}, "upsert": True})
+
+                if len(batch) >= batch_size:
+                    # Bound the batches held in memory to the ones being written
+                    if len(in_flight) >= workers * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+
+                    in_flight.add(executor.submit(write, batch))
+                    batch = []
+                    batches += 1
+
+                    if batches % 100 == 0:
+                        logging.info(f"Import progress {stats}")
+
+            if batch:
+                in_flight.add(executor.submit(write, batch))
+
+            done, _ = wait(in_flight)
+            collect(done)
+    finally:
+        logging.info("Building 2dsphere index")
+        db.create_index(collection_name, [("location", "2dsphere")])
+
+    stats["seconds"] = round(time.time() - start, 1)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="The dataset file, optionally gzipped")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="Defaults to the file extension")
+    parser.add_argument("--db-host", default=os.environ.get('DB_HOST'), help="Defaults to $DB_HOST")
+    parser.add_argument("--db-name", default=os.environ.get('APP_DB'), help="Defaults to $APP_DB")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--keep-index", action="store_true",
+                        help="Keep the 2dsphere index while importing, so nearby queries keep working on a live "
+                             "database at the cost of a slower import")
+    args = parser.parse_args()
+
+    db = DatabaseInterface(args.db_host, args.db_name)
+    records = iter_records(args.path, args.format or detect_format(args.path))
+
+    stats = import_locations(db, records, args.batch_size, args.workers, not args.keep_index)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
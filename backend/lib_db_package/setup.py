@@ -7,4 +7,10 @@ setup(
     install_requires=[
         'pymongo', 'requests'
     ],
+    extras_require={
+        'geojson': ['ijson>=3.1']
+    },
+    entry_points={
+        'console_scripts': ['lib-db-import=lib_db.importer:main']
+    },
 )
@@ -0,0 +1,10 @@
+import pytest
+from lib_db import DatabaseInterface
+
+
+@pytest.fixture(params=["file", "memory"])
+def db(request, tmp_path):
+    connection_string = f"sqlite:///{tmp_path / 'app.db'}" if request.param == "file" else "sqlite://"
+    db = DatabaseInterface(connection_string, "appDb")
+    yield db
+    db.close()
@@ -0,0 +1,22 @@
+import asyncio
+from lib_db import WriteBatcher
+
+
+def test_failed_operation_does_not_drop_later_writes(db):
+    db.insert_many("lists", [{"list_id": "a", "items": []}, {"list_id": "b", "items": "corrupt"},
+                             {"list_id": "c", "items": []}])
+
+    async def write():
+        batcher = WriteBatcher(db, "lists", window=0.01)
+        results = await asyncio.gather(
+            batcher.push_to_items_list("a", {"item": "milk"}),
+            batcher.push_to_items_list("b", {"item": "milk"}),
+            batcher.remove_from_items_list("a", "milk"),
+            batcher.push_to_items_list("c", {"item": "bread"}),
+            batcher.push_to_items_list("a", {"item": "eggs"}))
+        await batcher.close()
+        return results
+
+    assert asyncio.run(write()) == [1, None, 1, 1, 1]
+    assert db.find_one("lists", {"list_id": "a"})["items"] == [{"item": "eggs"}]
+    assert db.find_one("lists", {"list_id": "c"})["items"] == [{"item": "bread"}]
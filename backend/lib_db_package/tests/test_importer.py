@@ -0,0 +1,31 @@
+import pytest
+from lib_db.importer import import_locations, map_types
+
+
+def feature(place_id, shop, x=0.0, y=0.0):
+    return {"type": "Feature", "id": place_id, "properties": {"shop": shop, "name": place_id},
+            "geometry": {"type": "Point", "coordinates": [x, y]}}
+
+
+def test_map_types_ignores_non_string_categories():
+    assert map_types({"categories": [None, 7, "Bakery"]}) == ["bakery"]
+    assert map_types({"amenity": 7}) == []
+
+
+def test_import_skips_bad_rows_and_duplicates(db):
+    records = [feature("a", "bakery"), {"properties": None}, feature("a", "bakery"), feature("b", ["pet", None])]
+
+    stats = import_locations(db, records, batch_size=1, dedupe_window=1)
+    assert {key: stats[key] for key in ("read", "skipped", "duplicates", "upserted")} == \
+        {"read": 4, "skipped": 1, "duplicates": 1, "upserted": 2}
+    assert db.has_nearby_locations("locations", [0, 0], 100) is True
+
+
+def test_failed_import_rebuilds_deferred_index(db):
+    def records():
+        yield feature("a", "bakery")
+        raise OSError("truncated file")
+
+    with pytest.raises(OSError):
+        import_locations(db, records(), defer_index=True)
+    assert db.has_nearby_locations("locations", [0, 0], 100) is False
@@ -0,0 +1,135 @@
+import threading
+import pytest
+from lib_db import DatabaseInterface
+from lib_db.backends import Backend
+from lib_db.db import NEARBY_ITEM_PROJECTION
+
+
+def location(place_id: str, x: float, y: float):
+    return {"placeId": place_id, "name": place_id, "vicinity": "", "types": ["bakery"],
+            "location": {"type": "Point", "coordinates": [x, y]}}
+
+
+def test_push_pull_and_positional_set(db):
+    db.insert_one("lists", {"list_id": "a", "items": []})
+    db.push_to_items_list("lists", "a", {"item": "milk", "tag": "x", "id": "1"})
+    db.push_to_items_list("lists", "a", {"item": "bread", "tag": "x", "id": "2"})
+
+    assert db.update_item_in_list("lists", "a", "2", {"tag": "bakery"}) == 1
+    assert db.update_item_in_list("lists", "a", "missing", {"tag": "bakery"}) == 0
+    assert db.remove_from_items_list("lists", "a", "milk") == 1
+
+    user_list = db.find_one("lists", {"list_id": "a"})
+    assert user_list["items"] == [{"item": "bread", "tag": "bakery", "id": "2"}]
+    assert "_id" not in user_list and user_list["id"]
+
+
+def test_retag_with_array_filters(db):
+    items = [{"item": "milk", "tag": "x", "id": "1"}, {"item": "milk", "tag": "x", "id": "2"},
+             {"item": "soap", "tag": "x", "id": "3"}]
+    db.insert_one("lists", {"list_id": "a", "items": items})
+
+    operation = DatabaseInterface.retag_items_operation("a", {"milk": "grocery_or_supermarket", "soap": "drugstore"})
+    assert db.bulk_write("lists", [operation]) == 1
+
+    user_list = db.find_one("lists", {"list_id": "a"}, projection=NEARBY_ITEM_PROJECTION)
+    assert [item["tag"] for item in user_list["items"]] == ["grocery_or_supermarket"] * 2 + ["drugstore"]
+    assert set(user_list) == {"items", "id"}
+
+
+def test_upsert(db):
+    upserted_id = db.upsert_one("jobs", {"job_id": "retag"}, {"status": "running"})
+    assert upserted_id is not None
+    assert db.upsert_one("jobs", {"job_id": "retag"}, {"status": "done"}) is None
+
+    assert db.find_all("jobs") == [{"job_id": "retag", "status": "done", "id": upserted_id}]
+
+
+def test_find_one_and_update(db):
+    claim = {"job_id": "retag", "$or": [{"lease_until": {"$lt": 10}}, {"lease_until": {"$exists": False}}]}
+
+    created = db.find_one_and_update("jobs", {"job_id": "retag"}, {"$set": {"job_id": "retag"}}, upsert=True)
+    assert created["job_id"] == "retag"
+    assert db.find_one_and_update("jobs", claim, {"$set": {"lease_until": 20, "owner": "a"}})["owner"] == "a"
+    assert db.find_one_and_update("jobs", claim, {"$set": {"lease_until": 20, "owner": "b"}}) is None
+    assert len(db.find_all("jobs")) == 1
+
+
+def test_bulk_write_failures(db):
+    db.insert_one("lists", {"list_id": "a", "items": []})
+    operations = [
+        DatabaseInterface.push_items_operation("a", [{"item": "milk"}]),
+        {"filter": {"list_id": "a"}, "update": {"$set": {"items.$.tag": "x"}}},
+        DatabaseInterface.push_items_operation("a", [{"item": "bread"}]),
+    ]
+
+    assert db.bulk_write("lists", operations, ordered=True) == 1
+    assert db.bulk_write("lists", operations, ordered=False) == 2
+    assert [item["item"] for item in db.find_one("lists", {"list_id": "a"})["items"]] == ["milk", "milk", "bread"]
+
+
+def test_nearby_uses_mongo_geometry(db):
+    # Coordinates are [x, y], longitude first, like MongoDB's 2dsphere
+    db.insert_many("locations", [location("east", 0.02, 60), location("north", 0, 60.015), location("far", 1, 61)])
+
+    nearby = db.find_nearby_locations("locations", [0, 60], 2000)
+    assert [doc["placeId"] for doc in nearby] == ["east", "north"]
+    assert [doc["placeId"] for doc in db.find_nearby_locations("locations", [0, 60], 1500)] == ["east"]
+
+    assert db.has_nearby_locations("locations", [0, 60], 1500) is True
+    assert db.has_nearby_locations("locations", [0, 60], 500) is False
+
+
+def test_nearby_follows_writes_and_index_rebuild(db):
+    db.insert_one("locations", location("a", 0, 0))
+    db.bulk_write("locations", [{"filter": {"placeId": "a"},
+                                 "update": {"$set": {"location.coordinates": [10, 10]}}}])
+    assert db.has_nearby_locations("locations", [0, 0], 1000) is False
+    assert db.has_nearby_locations("locations", [10, 10], 1000) is True
+
+    assert db.drop_index("locations", [("location", "2dsphere")]) is True
+    assert db.has_nearby_locations("locations", [10, 10], 1000) is None
+    db.create_index("locations", [("location", "2dsphere")])
+    assert db.has_nearby_locations("locations", [10, 10], 1000) is True
+
+    db.delete_one("locations", {"placeId": "a"})
+    assert db.has_nearby_locations("locations", [10, 10], 1000) is False
+
+
+def test_iter_documents_resumes(db):
+    db.insert_many("lists", [{"list_id": str(n), "items": [], "even": n % 2 == 0} for n in range(10)])
+
+    documents = list(db.iter_documents("lists", {"even": True}, projection={"list_id": 1}, batch_size=3))
+    assert [doc["list_id"] for doc in documents] == ["0", "2", "4", "6", "8"]
+
+    resumed = db.iter_documents("lists", projection={"list_id": 1}, after_id=documents[2]["id"], batch_size=2)
+    assert [doc["list_id"] for doc in resumed] == ["5", "6", "7", "8", "9"]
+
+
+def test_concurrent_writes(db):
+    db.insert_one("lists", {"list_id": "a", "items": []})
+    errors = []
+
+    def push(worker: int):
+        for n in range(100):
+            if db.push_to_items_list("lists", "a", {"item": f"{worker}-{n}"}) != 1:
+                errors.append((worker, n))
+            db.find_one("lists", {"list_id": "a"}, projection={"list_id": 1})
+
+    threads = [threading.Thread(target=push, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(db.find_one("lists", {"list_id": "a"})["items"]) == 400
+
+
+def test_incomplete_backend_fails_on_construction():
+    class Incomplete(Backend):
+        def close(self):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,144 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+# PyJWT is the faster HS256 backend, python-jose is kept as the fallback
+try:
+    import jwt as pyjwt
+    JWT_BACKEND = "pyjwt"
+except ImportError:
+    from jose import jwt as jose_jwt
+    JWT_BACKEND = "jose"
+
+
+class InvalidTokenError(Exception):
+    """ Raised when a token fails verification or has no subject """
+
+
+class TokenCache:
+    """ Bounded LRU cache of verified tokens keyed by their SHA-256 digest """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def digest(token: str):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        """
+        Return the client ID and expiry of a previously verified token.
+
+        :param token: The encoded token.
+        :return: A (client_id, expires_at) tuple, or None if the token is not cached or has expired.
+        """
+        key = self.digest(token)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            client_id, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return client_id, expires_at
+
+    def put(self, token: str, client_id: str, expires_at: float):
+        """
+        Cache a verified token until its expiry.
+
+        :param token: The encoded token.
+        :param client_id: The token subject.
+        :param expires_at: The token 'exp' claim as a UNIX timestamp.
+        """
+        key = self.digest(token)
+
+        with self.lock:
+            self.entries[key] = (client_id, expires_at)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+class TokenAuthority:
+    """ Issues and verifies HS256 access tokens, caching verified tokens """
+
+    algorithm = "HS256"
+
+    def __init__(self, secret_key: str, expiry_minutes: int, cache_size: int = 10000):
+        self.secret_key = secret_key
+        self.expiry_minutes = expiry_minutes
+        self.cache = TokenCache(cache_size)
+        logging.info(f"Using {JWT_BACKEND} JWT backend")
+
+    def encode(self, payload: dict):
+        if JWT_BACKEND == "pyjwt":
+            return pyjwt.encode(payload, self.secret_key, algorithm=self.algorithm)
+        return jose_jwt.encode(payload, self.secret_key, algorithm=self.algorithm)
+
+    def decode(self, token: str):
+        try:
+            if JWT_BACKEND == "pyjwt":
+                return pyjwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            return jose_jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except Exception as e:
+            raise InvalidTokenError(str(e)) from e
+
+    def issue(self, client_ids: list):
+        """
+        Issue access tokens for a batch of clients sharing one expiry.
+
+        Tokens are only cached once verified, since anyone can request tokens and seeding them
+        would let anonymous callers evict the cached tokens of active clients.
+
+        :param client_ids: The client IDs to issue tokens for.
+        :return: A list of (client_id, access_token) tuples.
+        """
+        expires_at = int(time.time()) + self.expiry_minutes * 60
+        return [(client_id, self.encode({"sub": client_id, "exp": expires_at})) for client_id in client_ids]
+
+    def authenticate(self, token: str):
+        """
+        Verify a token, using the cache when it has already been verified.
+
+        :param token: The encoded token.
+        :return: A (client_id, expires_at) tuple, expires_at is None for tokens without an expiry.
+        :raises InvalidTokenError: If the token is invalid, expired or has no subject.
+        """
+        cached = self.cache.get(token)
+        if cached is not None:
+            return cached
+
+        payload = self.decode(token)
+        client_id = payload.get("sub")
+
+        if client_id is None:
+            raise InvalidTokenError("Token has no subject")
+
+        # Tokens without an expiry are not cached
+        if payload.get("exp") is None:
+            return client_id, None
+
+        expires_at = float(payload["exp"])
+        self.cache.put(token, client_id, expires_at)
+        return client_id, expires_at
+
+    def verify(self, token: str):
+        """
+        Verify a token, using the cache when it has already been verified.
+
+        :param token: The encoded token.
+        :return: The client ID the token was issued for.
+        :raises InvalidTokenError: If the token is invalid, expired or has no subject.
+        """
+        client_id, _ = self.authenticate(token)
+        return client_id
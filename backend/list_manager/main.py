@@ -1,16 +1,20 @@
 
 import os
+import time
+import asyncio
 import logging
 import requests
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Depends, Header, status, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
-from lib_db import DatabaseInterface
-from .models import GeoLocation, EditListItem, SearchNearby, Location
-from datetime import datetime, timedelta
-from jose import jwt
+from lib_db import DatabaseInterface, WriteBatcher
+from .models import GeoLocation, EditListItem, SearchNearby, Location, TokenRequest, NearbyUpdate, StreamAuth
+from .auth import TokenAuthority, InvalidTokenError
+from .stream import diff_nearby
+from .retag import RetagJob, normalize_tag
 
 
 logging.basicConfig(
@@ -18,41 +22,55 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-ALGORITHM = "HS256"
-
 try:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     TOKEN_EXPIRY = int(os.environ.get('TOKEN_EXPIRY_MINUTES'))
-    db = DatabaseInterface(os.environ.get('DB_HOST'), os.environ.get('APP_DB'))
+    TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+    WRITE_BATCH_WINDOW = float(os.environ.get('WRITE_BATCH_WINDOW_MS', 5)) / 1000
+    MODEL_TIMEOUT = float(os.environ.get('MODEL_TIMEOUT_SECONDS', 5))
+    db_host = os.environ.get('DB_HOST')
+    db_name = os.environ.get('APP_DB')
     places_api_key = os.environ.get('API_KEY', "")
-    model_manager_url = f"{os.environ.get('MODEL_MANAGER_HOST')}/api/tag_item"
+    model_manager_host = os.environ.get('MODEL_MANAGER_HOST')
+    model_manager_url = f"{model_manager_host}/api/tag_item"
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
     notification_manager_url = f"{os.environ.get('NOTIFICATION_MANAGER_HOST')}/api/search_nearby"
 except Exception as ex:
     logging.error(f"Error: Missing environment variable. {ex}")
     raise ex
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Clients are created per worker process on startup, see startup()
+db: DatabaseInterface = None
+http: requests.Session = None
+list_writes: WriteBatcher = None
+retag_job: RetagJob = None
 
-def get_client(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+MAX_TOKEN_BATCH = 100
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        client_id: str = payload.get("sub")
+# Seconds a nearby stream connection has to send its access token
+STREAM_AUTH_TIMEOUT = 10
 
-        if client_id is None:
-            raise credentials_exception
+token_authority = TokenAuthority(SECRET_KEY, TOKEN_EXPIRY, TOKEN_CACHE_SIZE)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-    except jwt.JWTError:
-        raise credentials_exception
-    return client_id
+async def get_client(token: str = Depends(oauth2_scheme)):
+    # Async so cached verifications don't pay for a threadpool hop
+    try:
+        return token_authority.verify(token)
+    except InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
+def get_admin(x_admin_token: str = Header(None)):
+    # Admin endpoints are disabled unless ADMIN_TOKEN is set
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
-app = FastAPI()
+
+app = FastAPI(default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -63,6 +81,37 @@ app.add_middleware(
 print(os.getcwd())
 app.mount("/code/app/static", StaticFiles(directory="/code/app/static"), name="/code/app/static")
 
+@app.on_event("startup")
+def startup():
+   """
+   Create the database and HTTP clients for this worker process.
+   """
+   global db, http, list_writes
+
+   try:
+      db = DatabaseInterface(db_host, db_name)
+      http = requests.Session()
+      list_writes = WriteBatcher(db, "lists", window=WRITE_BATCH_WINDOW)
+      logging.info("Database and HTTP clients initialized")
+   except Exception as ex:
+      logging.error(f"Error: Failed to initialize clients. {ex}")
+      raise ex
+
+@app.on_event("shutdown")
+async def shutdown():
+   """
+   Flush pending list writes and close the database and HTTP clients once in-flight requests have drained.
+   """
+   if retag_job:
+      retag_job.stop()
+   if list_writes:
+      await list_writes.close()
+   if http:
+      http.close()
+   if db:
+      db.close()
+   logging.info("Database and HTTP clients closed")
+
 @app.get("/", include_in_schema=False)
 def root():
     with open("/code/app/static/index.html", "r", encoding="utf-8") as file:
@@ -72,13 +121,72 @@ def root():
 @app.get("/api/token")
 async def generate_token(client_id: str):
     # Generate an access token with expiration
-    expires_delta = timedelta(minutes=TOKEN_EXPIRY)
-    token_data = {"sub": client_id, "exp": datetime.utcnow() + expires_delta}  # You can customize this based on your needs
-    data = token_data.copy()
-    access_token = jwt.encode(data, SECRET_KEY, algorithm="HS256")
+    [(_, access_token)] = token_authority.issue([client_id])
 
     return {"access_token": access_token, "expires_in": TOKEN_EXPIRY * 60}
 
+@app.post("/api/token")
+async def generate_tokens(body: TokenRequest):
+   """
+   Generate access tokens for a batch of clients.
+
+   Parameters:
+   - **body** (TokenRequest): Object containing the client IDs.
+
+   Returns:
+   - A list of access tokens with their client ID and expiry in seconds.
+
+   Raises:
+   - **HTTPException**: If more than MAX_TOKEN_BATCH client IDs are requested.
+   """
+   if len(body.client_ids) > MAX_TOKEN_BATCH:
+      raise HTTPException(status_code=400, detail=f"At most {MAX_TOKEN_BATCH} client IDs per request")
+
+   return [
+      {"client_id": client_id, "access_token": access_token, "expires_in": TOKEN_EXPIRY * 60}
+      for client_id, access_token in token_authority.issue(body.client_ids)
+   ]
+
+def tag_item(item: str):
+   """
+   Tag an item with the model manager, which drops the request once MODEL_TIMEOUT passes.
+
+   Raises:
+   - **HTTPException**: 503 or 429 with the model manager's Retry-After while it sheds load.
+   """
+   response = http.get(
+      model_manager_url,
+      params={"item": item},
+      headers={"X-Request-Timeout": str(MODEL_TIMEOUT)},
+      timeout=MODEL_TIMEOUT)
+
+   # Pass load shedding through to the client so it retries later instead of seeing a server error
+   if response.status_code in (429, 503):
+      raise HTTPException(
+         status_code=response.status_code,
+         detail="Tagging unavailable, retry later",
+         headers={"Retry-After": response.headers.get("Retry-After", "1")})
+
+   response.raise_for_status()
+   return response.json()
+
+def notify_nearby(client_id: str, location: Location, radius: int, token: str):
+   """
+   Forward a client's location to the notification manager.
+   """
+   http.post(
+      notification_manager_url,
+      json={
+         "location": {
+         "latitude": location.latitude,
+         "longitude": location.longitude
+         },
+         "list_id": client_id,
+         "radius": radius,
+         "token": token
+      }
+   )
+
 @app.post("/api/geolocation")
 async def geo_location(body: GeoLocation, client_id: dict = Depends(get_client)):  # TODO encrpt token
    """
@@ -94,18 +202,7 @@ async def geo_location(body: GeoLocation, client_id: dict = Depends(get_client))
    - **HTTPException**: If an error occurs during the process.
    """
    try:
-      requests.post(
-         notification_manager_url,
-         json={
-            "location": {
-            "latitude": body.location.latitude,
-            "longitude": body.location.longitude
-            },
-            "list_id": client_id,
-            "radius": body.radius,
-            "token": body.token
-         }
-      )
+      notify_nearby(client_id, body.location, body.radius, body.token)
    except Exception as e:
       logging.error(f"Error geo_location failed. {e}")
       raise HTTPException(status_code=500, detail="Server error")
@@ -114,7 +211,7 @@ async def geo_location(body: GeoLocation, client_id: dict = Depends(get_client))
 @app.get("/api/create_list")
 async def create_list(client_id: dict = Depends(get_client)):
    try:
-      list_exists = db.find_one("lists", {"list_id": client_id})
+      list_exists = db.find_one("lists", {"list_id": client_id}, projection={"list_id": 1})
       print(list_exists)
       if not list_exists:
          db.insert_one("lists", {"list_id": client_id, "items": []})
@@ -164,6 +261,80 @@ async def items_nearby(body: SearchNearby, client_id: dict = Depends(get_client)
       raise HTTPException(status_code=500, detail="Server error")
 
 
+async def receive_json(websocket: WebSocket, timeout: float = None):
+   """
+   Receive a JSON message, raising ValueError for binary frames and asyncio.TimeoutError after timeout seconds.
+   """
+   try:
+      return await asyncio.wait_for(websocket.receive_json(), timeout)
+   except KeyError as e:
+      # Starlette reads the 'text' key of the frame, which binary frames don't have
+      raise ValueError("Expected a JSON text message") from e
+
+
+@app.websocket("/api/items_nearby/stream")
+async def items_nearby_stream(websocket: WebSocket):
+   """
+   Stream nearby items over a single long-lived WebSocket connection.
+
+   The access token is sent in the first message, so it never appears in the URL or the access log,
+   and the connection is closed when the token expires. The client then sends NearbyUpdate messages
+   as its location changes, and receives only the changes to the nearby items since the previous update.
+
+   Messages:
+   - **received first** (StreamAuth): Object containing the access token, within STREAM_AUTH_TIMEOUT seconds.
+   - **received** (NearbyUpdate): Object containing location, radius, and optional push token.
+   - **sent**: Object containing 'added' and 'updated' items and 'removed' item IDs, or an 'error'.
+   """
+   await websocket.accept()
+
+   try:
+      auth = StreamAuth(**await receive_json(websocket, STREAM_AUTH_TIMEOUT))
+      client_id, expires_at = token_authority.authenticate(auth.access_token)
+   except (InvalidTokenError, ValueError, TypeError, asyncio.TimeoutError):
+      await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+      return
+   except WebSocketDisconnect:
+      return
+
+   previous = {}
+
+   try:
+      while True:
+         try:
+            expires_in = None if expires_at is None else expires_at - time.time()
+            body = NearbyUpdate(**await receive_json(websocket, expires_in))
+         except asyncio.TimeoutError:
+            logging.info(f"Nearby stream token expired for {client_id}")
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+         except (ValueError, TypeError) as e:
+            await websocket.send_json({"error": f"Invalid update. {e}"})
+            continue
+
+         try:
+            if body.token:
+               await run_in_threadpool(notify_nearby, client_id, body.location, body.radius, body.token)
+
+            items = await run_in_threadpool(
+               db.find_nearby_items, client_id, float(body.location.latitude), float(body.location.longitude), body.radius)
+         except Exception as e:
+            logging.error(f"Error items_nearby_stream failed. {e}")
+            items = None
+
+         if items is None:
+            await websocket.send_json({"error": "Server error"})
+            continue
+
+         changes = diff_nearby(previous, items)
+         previous = {item["id"]: item for item in items}
+
+         if changes["added"] or changes["updated"] or changes["removed"]:
+            await websocket.send_json(changes)
+   except WebSocketDisconnect:
+      logging.info(f"Nearby stream closed for {client_id}")
+
+
 @app.post("/api/add_list_item")
 async def add_list_item(item: EditListItem, client_id: dict = Depends(get_client) ):
    """
@@ -176,20 +347,21 @@ async def add_list_item(item: EditListItem, client_id: dict = Depends(get_client
    - **str**: "OK" if successful.
 
    Raises:
-   - **HTTPException**: If an error occurs during the process.
+   - **HTTPException**: 503 or 429 with Retry-After while the model manager sheds load, or 500 if an error occurs.
    """
    
    try:
-      tag = requests.get(f"{model_manager_url}?item={item.item}").json()
+      tag = normalize_tag(await run_in_threadpool(tag_item, item.item))
 
-      if "grocery" in tag or "supermarket" in tag:
-         tag = "grocery_or_supermarket"
-
-      db.push_to_items_list('lists', client_id, {
+      applied = await list_writes.push_to_items_list(client_id, {
          "item": item.item,
          "tag": tag,
          "id": str(abs(hash(item.item)))})
+      if applied is None:
+         raise RuntimeError("List write failed")
       return "OK"
+   except HTTPException:
+      raise
    except Exception as e:
       logging.error(f"Error add_list_item failed. {e}")
       raise HTTPException(status_code=500, detail="Server error")
@@ -210,7 +382,9 @@ async def remove_from_items_list(item: EditListItem, client_id: dict = Depends(g
    - **HTTPException**: If an error occurs during the process.
    """
    try:
-      db.remove_from_items_list('lists', client_id, item.item)
+      applied = await list_writes.remove_from_items_list(client_id, item.item)
+      if applied is None:
+         raise RuntimeError("List write failed")
       return "OK"
    except Exception as e:
       logging.error(f"Error remove_list_item failed. {e}")
@@ -229,19 +403,61 @@ async def update_item_in_list(item: EditListItem, client_id: dict = Depends(get_
    - **str**: "OK" if successful.
 
    Raises:
-   - **HTTPException**: If an error occurs during the process.
+   - **HTTPException**: 503 or 429 with Retry-After while the model manager sheds load, or 500 if an error occurs.
    """
    try:
-      db.update_item_in_list('lists', client_id, item.id, {
+      tag = await run_in_threadpool(tag_item, item.item)
+
+      applied = await list_writes.update_item_in_list(client_id, item.id, {
          "item": item.item,
-         "tag": requests.get(f"{model_manager_url}?item={item.item}").json(),
+         "tag": tag,
          "id": str(abs(hash(item.item)))})
+      if applied is None:
+         raise RuntimeError("List write failed")
       return "OK"
+   except HTTPException:
+      raise
    except Exception as e:
       logging.error(f"Error update_list_item failed. {e}")
       raise HTTPException(status_code=500, detail="Server error")
 
 
+@app.post("/api/admin/retag", dependencies=[Depends(get_admin)])
+async def start_retag(restart: bool = False):
+   """
+   Start retagging every stored list item with the current model version in the background.
+
+   Parameters:
+   - **restart** (bool, optional): Ignore the checkpoint and retag every list.
+
+   Returns:
+   - **str**: "Started" if the job was started.
+
+   Raises:
+   - **HTTPException**: If the job is already running.
+   """
+   global retag_job
+
+   # The lease is claimed atomically on the shared checkpoint, so this also sees jobs started by other workers
+   job = RetagJob(db, model_manager_host, http)
+   if not job.claim():
+      raise HTTPException(status_code=409, detail="Retag already running")
+
+   retag_job = job
+   retag_job.start(restart)
+   return "Started"
+
+@app.get("/api/admin/retag", dependencies=[Depends(get_admin)])
+async def retag_status():
+   """
+   Get the checkpoint of the retag job.
+
+   Returns:
+   - The job status, model version, last list ID and progress counters.
+   """
+   return RetagJob(db, model_manager_host, http).checkpoint()
+
+
 @app.post("/api/load_locations")  # 43.810056,-79.459944
 async def load_locations(geo_location: Location, client_id: dict = Depends(get_client)):
    """
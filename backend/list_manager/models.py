@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic import BaseModel
 
 
@@ -41,4 +42,34 @@ class GeoLocation(BaseModel):
     """
     location: Location
     radius: int = 10000
-    token: str
\ No newline at end of file
+    token: str
+
+class TokenRequest(BaseModel):
+    """
+    Represents a batch of clients to issue access tokens for.
+
+    - **client_ids**: The client IDs.
+    """
+    client_ids: List[str]
+
+
+class StreamAuth(BaseModel):
+    """
+    Represents the first message of the nearby items stream, authenticating the connection.
+
+    - **access_token**: The access token.
+    """
+    access_token: str
+
+
+class NearbyUpdate(BaseModel):
+    """
+    Represents a location update sent over the nearby items stream.
+
+    - **location**: The location coordinates.
+    - **radius** (optional): The search radius in meters (default is 200 meters).
+    - **token** (optional): The push notification token, when set the update is also sent to the notification manager.
+    """
+    location: Location
+    radius: int = 200
+    token: Optional[str] = None
@@ -0,0 +1,285 @@
+"""
+Retag every stored list item with the current model version.
+
+Usage (inside the list_manager container):
+    python -m app.retag [--restart] [--ops-per-second 500]
+"""
+import os
+import time
+import uuid
+import logging
+import argparse
+import threading
+import requests
+from lib_db import DatabaseInterface
+
+CHECKPOINTS = "jobs"
+
+# A lease not renewed for this long belongs to a job that died
+STALE_SECONDS = 120
+
+
+class LeaseLost(RuntimeError):
+    """ Raised when another job took over the lease of the job """
+
+
+def normalize_tag(tag: str):
+    """
+    Map the model's grocery labels onto the 'grocery_or_supermarket' location type.
+    """
+    if "grocery" in tag or "supermarket" in tag:
+        return "grocery_or_supermarket"
+    return tag
+
+
+class RetagJob:
+    """
+    Resumable job retagging the items of every list after the classifier changes.
+
+    Streams the lists collection in '_id' order, tags each distinct item text once through the
+    model manager's batched /api/tag_items endpoint, and writes changed tags back with bulk_write,
+    throttled to a target number of write operations per second. Progress is checkpointed in the
+    jobs collection after every batch, so a restarted job resumes where it stopped as long as the
+    model version hasn't changed. A job runs only while it holds the checkpoint's lease, which it
+    claims atomically and renews with every checkpoint and while sleeping, and it stops as soon as
+    a checkpoint write finds that another job took the lease over.
+    """
+
+    job_id = "retag"
+
+    def __init__(self, db: DatabaseInterface, model_manager_host: str, http: requests.Session = None,
+                 lists_per_batch: int = 200, tag_batch: int = 64, ops_per_second: float = 500,
+                 timeout: float = 30, max_retries: int = 20):
+        self.db = db
+        self.model_manager_host = model_manager_host
+        self.http = http or requests.Session()
+        self.lists_per_batch = lists_per_batch
+        self.tag_batch = tag_batch
+        self.ops_per_second = ops_per_second
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.stopped = threading.Event()
+        self.owner = uuid.uuid4().hex
+        self.claimed = False
+
+    # Model manager
+
+    def model_version(self):
+        response = self.http.get(f"{self.model_manager_host}/api/model", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["current"]["version"]
+
+    def tag(self, texts: list):
+        """
+        Tag distinct item texts in batches, backing off up to max_retries times per batch while the
+        model manager sheds load.
+
+        :return: A dict of item text to normalized tag.
+        """
+        tags = {}
+
+        for i in range(0, len(texts), self.tag_batch):
+            chunk = texts[i:i + self.tag_batch]
+            retries = 0
+
+            while True:
+                response = self.http.post(
+                    f"{self.model_manager_host}/api/tag_items",
+                    params={"priority": "batch"},
+                    json={"items": chunk},
+                    headers={"X-Request-Timeout": str(self.timeout)},
+                    timeout=self.timeout)
+
+                if response.status_code in (429, 503) and retries < self.max_retries and not self.stopped.is_set():
+                    retries += 1
+                    self.pause(float(response.headers.get("Retry-After", 1)))
+                    continue
+
+                response.raise_for_status()
+                break
+
+            tags.update(zip(chunk, (normalize_tag(tag) for tag in response.json()["tags"])))
+
+        return tags
+
+    # Checkpoints
+
+    def checkpoint(self):
+        return self.db.find_one(CHECKPOINTS, {"job_id": self.job_id})
+
+    def save_checkpoint(self, **fields):
+        """
+        Write the checkpoint if this job still holds the lease.
+
+        :raises LeaseLost: If another job took the lease over.
+        """
+        now = time.time()
+        # Running jobs renew their lease, stopped, failed and finished jobs release it
+        lease_until = now + STALE_SECONDS if fields.get("status") == "running" else 0
+        self.update_leased({"error": None, **fields, "updated_at": now, "lease_until": lease_until})
+
+    def update_leased(self, fields: dict):
+        checkpoint = self.db.find_one_and_update(
+            CHECKPOINTS, {"job_id": self.job_id, "owner": self.owner}, {"$set": fields})
+
+        if checkpoint is None:
+            self.claimed = False
+            raise LeaseLost("Retag lease was taken over by another job")
+
+    def claim(self):
+        """
+        Atomically take the lease of the job unless another job holds an unexpired one.
+
+        :return: True if this job holds the lease.
+        """
+        now = time.time()
+
+        # Create the checkpoint first, the unique index keeps concurrent first runs from inserting two
+        self.db.create_index(CHECKPOINTS, [("job_id", 1)], unique=True)
+        self.db.find_one_and_update(CHECKPOINTS, {"job_id": self.job_id}, {"$set": {"job_id": self.job_id}}, upsert=True)
+
+        checkpoint = self.db.find_one_and_update(
+            CHECKPOINTS,
+            {"job_id": self.job_id, "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}]},
+            {"$set": {"lease_until": now + STALE_SECONDS, "updated_at": now, "owner": self.owner}})
+
+        self.claimed = checkpoint is not None and checkpoint.get("owner") == self.owner
+        return self.claimed
+
+    def heartbeat(self):
+        now = time.time()
+        self.update_leased({"updated_at": now, "lease_until": now + STALE_SECONDS})
+
+    def pause(self, seconds: float):
+        """
+        Sleep without letting the lease go stale, waking up early when the job is stopped.
+        """
+        end = time.time() + seconds
+
+        while not self.stopped.is_set() and time.time() < end:
+            self.heartbeat()
+            self.stopped.wait(min(end - time.time(), STALE_SECONDS / 4))
+
+    # Job
+
+    def batches(self, after_id: str = None):
+        batch = []
+        documents = self.db.iter_documents(
+            "lists", projection={"list_id": 1, "items.item": 1, "items.tag": 1}, after_id=after_id)
+
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= self.lists_per_batch:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def run(self, restart: bool = False):
+        """
+        Run the job to completion, resuming from the last checkpoint of the same model version.
+
+        :param restart: (Optional) Ignore the checkpoint and start from the first list.
+        :return: The final checkpoint.
+        """
+        if not self.claimed and not self.claim():
+            raise RuntimeError("Retag already running")
+
+        version = self.model_version()
+        checkpoint = self.checkpoint() or {}
+        progress = {"lists": 0, "updated": 0, "texts": 0}
+        after_id = None
+
+        if not restart and checkpoint.get("model_version") == version:
+            if checkpoint.get("status") == "done":
+                logging.info(f"Retag already done for model version {version}")
+                return checkpoint
+
+            after_id = checkpoint.get("last_id")
+            progress = {key: checkpoint.get(key, 0) for key in progress}
+            logging.info(f"Resuming retag for model version {version} after list {after_id}")
+
+        self.save_checkpoint(status="running", model_version=version, last_id=after_id, **progress)
+
+        tags = {}
+        start = time.time()
+        written = 0
+
+        for batch in self.batches(after_id):
+            if self.stopped.is_set():
+                self.save_checkpoint(status="stopped", model_version=version, last_id=after_id, **progress)
+                logging.info("Retag stopped")
+                return self.checkpoint()
+
+            texts = list({item["item"] for document in batch for item in document.get("items", [])} - tags.keys())
+            tags.update(self.tag(texts))
+            progress["texts"] += len(texts)
+
+            operations = []
+            for document in batch:
+                changed = {
+                    item["item"]: tags[item["item"]]
+                    for item in document.get("items", [])
+                    if item.get("tag") != tags[item["item"]]
+                }
+                if changed:
+                    operations.append(DatabaseInterface.retag_items_operation(document["list_id"], changed))
+
+            if operations:
+                applied = self.db.bulk_write("lists", operations, ordered=False)
+                if applied is None:
+                    raise RuntimeError("Retag bulk_write failed")
+
+                progress["updated"] += applied
+                written += len(operations)
+
+                # Throttle to the target write rate
+                self.pause(written / self.ops_per_second - (time.time() - start))
+
+            after_id = batch[-1]["id"]
+            progress["lists"] += len(batch)
+            self.save_checkpoint(status="running", model_version=version, last_id=after_id, **progress)
+            logging.info(f"Retag progress {progress}")
+
+        self.save_checkpoint(status="done", model_version=version, last_id=after_id, **progress)
+        logging.info(f"Retag done in {time.time() - start:.1f}s {progress}")
+        return self.checkpoint()
+
+    def run_quietly(self, restart: bool = False):
+        try:
+            self.run(restart)
+        except LeaseLost as ex:
+            logging.error(f"Error retag stopped. {ex}")
+        except Exception as ex:
+            logging.error(f"Error retag failed. {ex}")
+            if self.claimed:
+                self.save_checkpoint(status="failed", error=str(ex))
+
+    def start(self, restart: bool = False):
+        """
+        Run the job on a background thread.
+        """
+        thread = threading.Thread(target=self.run_quietly, args=(restart,), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and retag every list")
+    parser.add_argument("--ops-per-second", type=float, default=500, help="Target bulk write operations per second")
+    parser.add_argument("--lists-per-batch", type=int, default=200)
+    args = parser.parse_args()
+
+    db = DatabaseInterface(os.environ.get('DB_HOST'), os.environ.get('APP_DB'))
+    job = RetagJob(db, os.environ.get('MODEL_MANAGER_HOST'),
+                   lists_per_batch=args.lists_per_batch, ops_per_second=args.ops_per_second)
+    print(job.run(args.restart))
+
+
+if __name__ == "__main__":
+    main()
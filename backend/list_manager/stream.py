@@ -0,0 +1,16 @@
+def diff_nearby(previous: dict, current: list):
+    """
+    Compare the latest nearby items against the previous result set.
+
+    :param previous: The previous result set keyed by item ID.
+    :param current: The latest list of combined items and locations from find_nearby_items.
+    :return: A dict of 'added' and 'updated' items and 'removed' item IDs.
+    """
+    current_by_id = {item["id"]: item for item in current}
+
+    added = [item for item_id, item in current_by_id.items() if item_id not in previous]
+    updated = [item for item_id, item in current_by_id.items()
+               if item_id in previous and previous[item_id] != item]
+    removed = [item_id for item_id in previous if item_id not in current_by_id]
+
+    return {"added": added, "updated": updated, "removed": removed}
@@ -0,0 +1,61 @@
+import time
+import pytest
+from auth import TokenAuthority, TokenCache, InvalidTokenError
+
+SECRET = "list-manager-test-secret-key-0123456789"
+
+
+@pytest.fixture
+def authority():
+    return TokenAuthority(SECRET, expiry_minutes=10, cache_size=2)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TokenCache(max_size=2)
+    expires_at = time.time() + 60
+    cache.put("a", "client-a", expires_at)
+    cache.put("b", "client-b", expires_at)
+
+    assert cache.get("a") == ("client-a", expires_at)
+    cache.put("c", "client-c", expires_at)
+
+    assert cache.get("b") is None
+    assert [cache.get(token)[0] for token in ("a", "c")] == ["client-a", "client-c"]
+
+
+def test_cache_drops_expired_tokens():
+    cache = TokenCache()
+    cache.put("a", "client-a", time.time() - 1)
+
+    assert cache.get("a") is None
+    assert len(cache.entries) == 0
+
+
+def test_verify_caches_only_verified_tokens(authority):
+    [(_, token)] = authority.issue(["client"])
+    assert len(authority.cache.entries) == 0
+
+    client_id, expires_at = authority.authenticate(token)
+    assert client_id == "client" and expires_at == pytest.approx(time.time() + 600, abs=5)
+    assert authority.cache.get(token) == (client_id, expires_at)
+    assert authority.verify(token) == "client"
+
+
+@pytest.mark.parametrize("payload, secret", [
+    ({"sub": "client", "exp": int(time.time()) - 10}, SECRET),
+    ({"sub": "client", "exp": int(time.time()) + 60}, SECRET[::-1]),
+    ({"exp": int(time.time()) + 60}, SECRET),
+])
+def test_rejected_tokens_are_not_cached(authority, payload, secret):
+    token = TokenAuthority(secret, expiry_minutes=10).encode(payload)
+
+    with pytest.raises(InvalidTokenError):
+        authority.verify(token)
+    assert len(authority.cache.entries) == 0
+
+
+def test_tokens_without_expiry_are_not_cached(authority):
+    token = authority.encode({"sub": "client"})
+
+    assert authority.authenticate(token) == ("client", None)
+    assert len(authority.cache.entries) == 0
@@ -1,11 +1,14 @@
 import os
+import time
 import torch
 import json 
 import logging
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header, Query, Depends, status
+from fastapi.responses import RedirectResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from .registry import ModelRegistry
+from .scheduler import InferenceScheduler, Overloaded, DeadlineExceeded
+from .models import ModelLoad, TagItems
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -13,8 +16,25 @@ logging.basicConfig(
 )
 
 labels_filepath = f"label_mapping.json"
+model_name = os.environ.get('MODEL_NAME', "beny2000/store_type_classifyer")
+model_state_filepath = os.environ.get('MODEL_STATE_FILE', "model_state.json")
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+max_queue = {
+    "interactive": int(os.environ.get('MAX_INTERACTIVE_QUEUE', 64)),
+    "batch": int(os.environ.get('MAX_BATCH_QUEUE', 16)),
+}
 
-app = FastAPI()
+# Models are loaded per worker process on startup, see startup()
+registry: ModelRegistry = None
+scheduler: InferenceScheduler = None
+
+def get_admin(x_admin_token: str = Header(None)):
+    # Admin endpoints are disabled unless ADMIN_TOKEN is set
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+
+app = FastAPI(default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -23,50 +43,192 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-try:
-    # Initialize model, tokenizer and labels
-    with open(labels_filepath, 'r') as labels:
-        label_mapping = json.load(labels)  
+@app.on_event("startup")
+async def startup():
+    """
+    Load the model, tokenizer and labels and start the inference scheduler for this worker process.
+    """
+    global registry, scheduler
+
+    try:
+        # Split the cores between the gunicorn workers so they don't oversubscribe the CPU
+        workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+        # Initialize model, tokenizer and labels
+        with open(labels_filepath, 'r') as labels:
+            label_mapping = json.load(labels)
 
-    model = AutoModelForSequenceClassification.from_pretrained("beny2000/store_type_classifyer")
-    tokenizer = AutoTokenizer.from_pretrained("beny2000/store_type_classifyer")
-    model.eval()
-    logging.info(f"Model initialized")
-except Exception as ex:
-    logging.error(f"Error: Failed to initialize model, tokenizer and labels. {ex}")
-    raise ex
+        registry = ModelRegistry({"source": model_name}, label_mapping, model_state_filepath)
+        registry.reconcile()
+        registry.watch()
+        logging.info(f"Model initialized")
 
+        scheduler = InferenceScheduler(registry.predict, max_queue)
+        scheduler.start()
+    except Exception as ex:
+        logging.error(f"Error: Failed to initialize model, tokenizer and labels. {ex}")
+        raise ex
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    if scheduler:
+        await scheduler.stop()
+    if registry:
+        registry.stop()
+
 @app.get("/", include_in_schema=False)
 def root():
     return RedirectResponse(url='/docs')
     
+def deadline_from(timeout: float):
+    return time.monotonic() + timeout if timeout else None
+
+async def shadow_compare(item: str, current_tag: str, current_seconds: float):
+    """
+    Tag an item with the shadow model at batch priority, so shadowing never delays interactive requests.
+    Comparisons are skipped while the scheduler sheds load.
+    """
+    try:
+        await scheduler.submit(
+            [item], "batch", predict=lambda items: registry.shadow_predict(items[0], current_tag, current_seconds))
+    except (Overloaded, DeadlineExceeded):
+        pass
+
 @app.get("/api/tag_item")
-async def get_list(item: str):
+async def get_list(item: str, background_tasks: BackgroundTasks,
+                   priority: str = Query("interactive", regex="^(interactive|batch)$"),
+                   x_request_timeout: float = Header(None)):
     """
-    Tag item using a pre-trained model.
+    Tag item using the current model version.
 
     Parameters:
     - **item** (str): The item to be tagged.
+    - **priority** (str, optional): 'interactive' (default) or 'batch', interactive requests are served first.
+    - **X-Request-Timeout** (header, optional): Seconds the caller will wait, the request is dropped once they pass.
 
     Returns:
     - **str**: The predicted tag for the item.
+
+    Raises:
+    - **HTTPException**: 503 or 429 with Retry-After when overloaded, or 500 if an error occurs.
     """
     try:
-        inputs = tokenizer(item, return_tensors="pt")
+        [(predicted_tag, top_tags)], version, seconds = await scheduler.submit(
+            [item], priority, deadline_from(x_request_timeout))
 
-        # Forward pass through the model
-        outputs = model(**inputs)
+        print(f"Top labels ({version.version}): {top_tags}")
 
-        # Get the predicted label
-        predicted_label = torch.argmax(outputs.logits, dim=1).item()
-        predicted_tag = label_mapping[str(predicted_label)]
+        # Compare a sample of traffic against the shadow model after responding
+        if registry.should_shadow():
+            background_tasks.add_task(shadow_compare, item, predicted_tag, seconds)
 
-        print(f"Top labels: {[label_mapping[str(i)] for i in torch.topk(outputs.logits, k=3, dim=1)[1].squeeze().tolist()]}")
-        
         return predicted_tag
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded:
+        raise HTTPException(status_code=503, detail="Request deadline exceeded",
+                            headers={"Retry-After": str(scheduler.retry_after(priority))})
     except Exception as e:
         logging.error(f"Error: Failed to tag item. {e}")
         raise HTTPException(status_code=500, detail="Server error") from e
+
+@app.post("/api/tag_items")
+async def tag_items(body: TagItems,
+                    priority: str = Query("batch", regex="^(interactive|batch)$"),
+                    x_request_timeout: float = Header(None)):
+    """
+    Tag a batch of items in a single forward pass using the current model version.
+
+    Parameters:
+    - **body** (TagItems): Object containing the items.
+    - **priority** (str, optional): 'batch' (default) or 'interactive'.
+    - **X-Request-Timeout** (header, optional): Seconds the caller will wait, the request is dropped once they pass.
+
+    Returns:
+    - The model version and the predicted tag of each item, in order.
+
+    Raises:
+    - **HTTPException**: 503 or 429 with Retry-After when overloaded, or 500 if an error occurs.
+    """
+    try:
+        predictions, version, _ = await scheduler.submit(body.items, priority, deadline_from(x_request_timeout))
+        return {"version": version.version, "tags": [tag for tag, _ in predictions]}
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+    except DeadlineExceeded:
+        raise HTTPException(status_code=503, detail="Request deadline exceeded",
+                            headers={"Retry-After": str(scheduler.retry_after(priority))})
+    except Exception as e:
+        logging.error(f"Error: Failed to tag items. {e}")
+        raise HTTPException(status_code=500, detail="Server error") from e
+
+@app.get("/api/model")
+async def model_version():
+    """
+    Get the model version served by this worker.
+
+    Returns:
+    - The current version, or None while no model is loaded.
+    """
+    return {"current": {"version": registry.current.version} if registry.current else None}
+
+@app.get("/api/model/status", dependencies=[Depends(get_admin)])
+async def model_status():
+    """
+    Get the model versions served by this worker and the shadow comparison metrics.
+
+    Returns:
+    - The current and shadow versions with their latency, the label agreement between them, and the scheduler queues.
+    """
+    return {**registry.status(), "scheduler": scheduler.status()}
+
+@app.post("/api/model/load", dependencies=[Depends(get_admin)])
+async def load_model(body: ModelLoad):
+    """
+    Load a new model version in the background, then swap it in or shadow it once warmed.
+
+    Parameters:
+    - **body** (ModelLoad): Object containing source, version, labels, shadow and sample_rate.
+
+    Returns:
+    - **str**: "Loading" once the request is recorded.
+
+    Raises:
+    - **HTTPException**: If an error occurs during the process.
+    """
+    try:
+        spec = {"source": body.source, "version": body.version, "labels": body.labels}
+        registry.load(spec, shadow=body.shadow, sample_rate=body.sample_rate)
+        return "Loading"
+    except Exception as e:
+        logging.error(f"Error: Failed to load model. {e}")
+        raise HTTPException(status_code=500, detail="Server error")
+
+@app.post("/api/model/promote", dependencies=[Depends(get_admin)])
+async def promote_model():
+    """
+    Promote the shadow model version to the current model version.
+
+    Returns:
+    - **str**: "OK" if successful.
+
+    Raises:
+    - **HTTPException**: If there is no shadow model version.
+    """
+    if not registry.promote():
+        raise HTTPException(status_code=409, detail="No shadow model to promote")
+    return "OK"
+
+@app.delete("/api/model/shadow", dependencies=[Depends(get_admin)])
+async def stop_shadow():
+    """
+    Stop shadowing and unload the shadow model version.
+
+    Returns:
+    - **str**: "OK" if successful.
+    """
+    registry.stop_shadow()
+    return "OK"
     
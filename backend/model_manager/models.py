@@ -0,0 +1,28 @@
+from typing import Optional
+from pydantic import BaseModel, confloat, conlist
+
+
+class ModelLoad(BaseModel):
+    """
+    Represents a model version to load.
+
+    - **source**: The Hugging Face hub name or local directory of the model or distilled student artifact.
+    - **version** (optional): The version name reported in metrics (default is the source).
+    - **labels** (optional): Path to the label mapping file (default is the source's label_mapping.json, then the bundled mapping).
+    - **shadow** (optional): Shadow the current model instead of replacing it (default is False).
+    - **sample_rate** (optional): The fraction of traffic run on the shadow model (default is 0.1).
+    """
+    source: str
+    version: Optional[str] = None
+    labels: Optional[str] = None
+    shadow: bool = False
+    sample_rate: confloat(ge=0.0, le=1.0) = 0.1
+
+
+class TagItems(BaseModel):
+    """
+    Represents a batch of items to tag.
+
+    - **items**: The items to be tagged, at most 64 per request.
+    """
+    items: conlist(str, min_items=1, max_items=64)
@@ -0,0 +1,393 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from collections import deque
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from .student import CharNgramClassifier
+
+WARMUP_ITEMS = ["milk", "bread", "toothpaste", "hammer", "dog food"]
+
+
+class TransformerClassifier:
+    """ Sequence classification model loaded with Hugging Face transformers """
+
+    def __init__(self, source: str, label_mapping: dict):
+        self.label_mapping = label_mapping
+        self.model = AutoModelForSequenceClassification.from_pretrained(source)
+        self.tokenizer = AutoTokenizer.from_pretrained(source)
+        self.model.eval()
+
+    def predict(self, items: list, k: int = 3):
+        """
+        Tag a batch of items.
+
+        :param items: The item texts to tag.
+        :param k: The number of top labels to return per item.
+        :return: A list of (tag, top_tags) tuples, one per item.
+        """
+        with torch.no_grad():
+            inputs = self.tokenizer(items, return_tensors="pt", padding=True, truncation=True)
+            logits = self.model(**inputs).logits
+
+        predicted_labels = torch.argmax(logits, dim=1).tolist()
+        top_labels = torch.topk(logits, k=min(k, logits.shape[1]), dim=1)[1].tolist()
+
+        return [
+            (self.label_mapping[str(label)], [self.label_mapping[str(i)] for i in top])
+            for label, top in zip(predicted_labels, top_labels)
+        ]
+
+
+def load_classifier(spec: dict, default_label_mapping: dict):
+    """
+    Load the classifier described by a model spec.
+
+    Local directories holding a distilled student artifact are served with CharNgramClassifier,
+    anything else is loaded as a transformers sequence classification model.
+
+    :param spec: A dict with the model 'source' (hub name or local directory) and optional 'labels' file path.
+    :param default_label_mapping: The label mapping used when the spec and source don't provide one.
+    :return: A classifier exposing predict(items).
+    """
+    label_mapping = default_label_mapping
+    labels_filepath = spec.get("labels") or os.path.join(spec["source"], "label_mapping.json")
+
+    if os.path.isfile(labels_filepath):
+        with open(labels_filepath, 'r') as labels:
+            label_mapping = json.load(labels)
+
+    if CharNgramClassifier.is_artifact(spec["source"]):
+        return CharNgramClassifier.load(spec["source"], label_mapping)
+
+    return TransformerClassifier(spec["source"], label_mapping)
+
+
+class LatencyStats:
+    """ Running latency statistics over a window of recent samples """
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def summary(self):
+        recent = sorted(self.recent)
+
+        def percentile(p):
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))] * 1000, 3) if recent else None
+
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else None,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+        }
+
+
+class ModelVersion:
+    """ A loaded and warmed classifier with its spec and serving metrics """
+
+    def __init__(self, spec: dict, classifier):
+        self.spec = spec
+        self.classifier = classifier
+        self.latency = LatencyStats()
+        self.loaded_at = time.time()
+
+    @property
+    def version(self):
+        return self.spec.get("version") or self.spec["source"]
+
+    def predict(self, items: list):
+        start = time.perf_counter()
+        predictions = self.classifier.predict(items)
+        self.latency.record(time.perf_counter() - start)
+        return predictions
+
+    def warm(self, items: list = None):
+        """
+        Run a few predictions so the first real request doesn't pay for lazy initialization.
+
+        :return: The latency of the last warmup prediction in seconds.
+        """
+        seconds = None
+
+        for item in items or WARMUP_ITEMS:
+            start = time.perf_counter()
+            self.classifier.predict([item])
+            seconds = time.perf_counter() - start
+
+        return seconds
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "spec": self.spec,
+            "loaded_at": self.loaded_at,
+            "latency": self.latency.summary(),
+        }
+
+
+class ShadowComparison:
+    """ Label agreement and latency of a shadow model against the current model """
+
+    def __init__(self, window: int = 50):
+        self.compared = 0
+        self.agreed = 0
+        self.current_latency = LatencyStats()
+        self.shadow_latency = LatencyStats()
+        self.disagreements = deque(maxlen=window)
+
+    def record(self, item: str, current_tag: str, current_seconds: float, shadow_tag: str, shadow_seconds: float):
+        self.compared += 1
+        self.current_latency.record(current_seconds)
+        self.shadow_latency.record(shadow_seconds)
+
+        if current_tag == shadow_tag:
+            self.agreed += 1
+        else:
+            self.disagreements.append({"item": item, "current": current_tag, "shadow": shadow_tag})
+
+    def summary(self):
+        return {
+            "compared": self.compared,
+            "agreement": round(self.agreed / self.compared, 4) if self.compared else None,
+            "current_latency": self.current_latency.summary(),
+            "shadow_latency": self.shadow_latency.summary(),
+            "recent_disagreements": list(self.disagreements),
+        }
+
+
+class ModelRegistry:
+    """
+    Serves the current model version and hot swaps new versions loaded in the background.
+
+    The desired state ({"current": spec, "shadow": spec, "sample_rate": float}) is kept in a
+    JSON state file shared by the worker processes of the container. Each worker polls the file
+    and reconciles its loaded models, so a change made through any worker reaches all of them.
+    Every change is stamped with 'requested_at', and workers retry specs that failed to load
+    once they see a newer request. A worker that can't load the current spec on startup serves
+    the default spec instead.
+    """
+
+    def __init__(self, default_spec: dict, default_label_mapping: dict, state_filepath: str, poll_interval: float = 5.0):
+        self.default_spec = default_spec
+        self.default_label_mapping = default_label_mapping
+        self.state_filepath = state_filepath
+        self.poll_interval = poll_interval
+
+        self.current: ModelVersion = None
+        self.shadow: ModelVersion = None
+        self.sample_rate = 0.0
+        self.comparison = ShadowComparison()
+        self.loading = None
+        self.last_error = None
+        self.failed_specs = []
+        self.requested_at = None
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.watcher = None
+
+    # State
+
+    def read_state(self):
+        """
+        Read the desired state, falling back to the default spec when no state file exists.
+        """
+        try:
+            with open(self.state_filepath, 'r') as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {"current": self.default_spec, "shadow": None, "sample_rate": 0.0}
+
+    def write_state(self, state: dict):
+        """
+        Atomically replace the desired state and reconcile this worker.
+        """
+        temp_filepath = f"{self.state_filepath}.{os.getpid()}.tmp"
+
+        # Stamp the request so every worker retries specs that failed before it
+        state["requested_at"] = time.time()
+
+        with open(temp_filepath, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_filepath, self.state_filepath)
+
+        self.reconcile_async()
+
+    def load(self, spec: dict, shadow: bool = False, sample_rate: float = 0.1):
+        """
+        Request a new model version, either as the current model or as a shadow model.
+        """
+        state = self.read_state()
+
+        if shadow:
+            state.update({"shadow": spec, "sample_rate": sample_rate})
+        else:
+            state.update({"current": spec})
+
+        self.write_state(state)
+
+    def promote(self):
+        """
+        Make the shadow model the current model.
+
+        :return: False if there is no shadow model to promote.
+        """
+        state = self.read_state()
+
+        if not state.get("shadow"):
+            return False
+
+        state.update({"current": state["shadow"], "shadow": None, "sample_rate": 0.0})
+        self.write_state(state)
+        return True
+
+    def stop_shadow(self):
+        state = self.read_state()
+        state.update({"shadow": None, "sample_rate": 0.0})
+        self.write_state(state)
+
+    # Loading
+
+    def build(self, spec: dict):
+        if spec in self.failed_specs:
+            raise ValueError("Model version previously failed to load")
+
+        logging.info(f"Loading model version {spec}")
+        version = ModelVersion(spec, load_classifier(spec, self.default_label_mapping))
+        warm_seconds = version.warm()
+        logging.info(f"Model version {version.version} warmed, last warmup prediction took {warm_seconds * 1000:.1f}ms")
+        return version
+
+    def reconcile(self):
+        """
+        Load, warm and swap in the models of the desired state that aren't loaded yet.
+
+        Swaps replace a single reference, so in-flight predictions finish on the version they started with.
+        """
+        with self.lock:
+            state = self.read_state()
+            current_spec = state.get("current") or self.default_spec
+            shadow_spec = state.get("shadow")
+
+            if state.get("requested_at") != self.requested_at:
+                self.failed_specs = []
+                self.requested_at = state.get("requested_at")
+
+            try:
+                if self.current is None or self.current.spec != current_spec:
+                    self.loading = current_spec
+
+                    if self.shadow is not None and self.shadow.spec == current_spec:
+                        version = self.shadow
+                    else:
+                        version = self.build(current_spec)
+
+                    self.current = version
+                    logging.info(f"Serving model version {version.version}")
+
+                if shadow_spec is None:
+                    self.shadow = None
+                elif self.shadow is None or self.shadow.spec != shadow_spec:
+                    self.loading = shadow_spec
+                    self.shadow = self.build(shadow_spec)
+                    self.comparison = ShadowComparison()
+                    logging.info(f"Shadowing model version {self.shadow.version}")
+
+                self.sample_rate = state.get("sample_rate", 0.0) if self.shadow else 0.0
+                self.last_error = None
+            except Exception as ex:
+                self.last_error = f"Failed to load {self.loading}. {ex}"
+                if self.loading not in self.failed_specs:
+                    self.failed_specs.append(self.loading)
+                    logging.error(f"Error: {self.last_error}")
+                if self.current is None:
+                    if current_spec == self.default_spec:
+                        raise ex
+                    self.fallback()
+            finally:
+                self.loading = None
+
+    def fallback(self):
+        """
+        Serve the default spec when the desired current spec fails to load on startup.
+        """
+        logging.error(f"Error: Falling back to the default model version {self.default_spec}")
+        self.loading = self.default_spec
+        self.current = self.build(self.default_spec)
+        logging.info(f"Serving model version {self.current.version}")
+
+    def reconcile_async(self):
+        threading.Thread(target=self.reconcile_quietly, daemon=True).start()
+
+    def reconcile_quietly(self):
+        try:
+            self.reconcile()
+        except Exception as ex:
+            logging.error(f"Error: Failed to reconcile models. {ex}")
+
+    def watch(self):
+        """
+        Start polling the state file for changes made through other workers.
+        """
+        def poll():
+            while not self.stopped.wait(self.poll_interval):
+                self.reconcile_quietly()
+
+        self.watcher = threading.Thread(target=poll, daemon=True)
+        self.watcher.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    # Serving
+
+    def predict(self, items: list):
+        """
+        Tag a batch of items with the current model.
+
+        :return: The predictions, the serving version and the prediction latency in seconds.
+        """
+        version = self.current
+        start = time.perf_counter()
+        predictions = version.predict(items)
+        return predictions, version, time.perf_counter() - start
+
+    def should_shadow(self):
+        return self.shadow is not None and random.random() < self.sample_rate
+
+    def shadow_predict(self, item: str, current_tag: str, current_seconds: float):
+        """
+        Tag an item with the shadow model and compare it against the current model's result.
+        """
+        shadow = self.shadow
+        if shadow is None:
+            return
+
+        try:
+            start = time.perf_counter()
+            [(shadow_tag, _)] = shadow.predict([item])
+            self.comparison.record(item, current_tag, current_seconds, shadow_tag, time.perf_counter() - start)
+        except Exception as ex:
+            logging.error(f"Error: Shadow model {shadow.version} failed to tag item. {ex}")
+
+    def status(self):
+        return {
+            "pid": os.getpid(),
+            "current": self.current.describe() if self.current else None,
+            "shadow": self.shadow.describe() if self.shadow else None,
+            "sample_rate": self.sample_rate,
+            "comparison": self.comparison.summary() if self.shadow else None,
+            "loading": self.loading,
+            "last_error": self.last_error,
+        }
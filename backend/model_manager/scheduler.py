@@ -0,0 +1,165 @@
+import math
+import time
+import asyncio
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class Overloaded(Exception):
+    """ Raised when a request is shed instead of queued """
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class DeadlineExceeded(Exception):
+    """ Raised when a request's deadline passed before it could run """
+
+
+class Job:
+    def __init__(self, items: list, priority: str, deadline: float, future: asyncio.Future, predict=None):
+        self.items = items
+        self.priority = priority
+        self.deadline = deadline
+        self.future = future
+        self.predict = predict
+
+
+class InferenceScheduler:
+    """
+    Admission control and priority scheduling in front of the model.
+
+    Requests are queued per priority class with a bound on each queue. Interactive requests
+    always run before batch requests. Requests are shed with 503 (interactive) or 429 (batch)
+    and a Retry-After when their queue is full or their deadline can't be met, and dropped
+    without running when their deadline passes while queued.
+    Inference runs on a single background thread so it never blocks the event loop.
+    """
+
+    def __init__(self, predict, max_queue: dict = None, smoothing: float = 0.2):
+        self.predict = predict
+        self.max_queue = max_queue or {"interactive": 64, "batch": 16}
+        self.smoothing = smoothing
+
+        self.queue = None
+        self.queued = {priority: 0 for priority in PRIORITIES}
+        self.queued_items = {priority: 0 for priority in PRIORITIES}
+        self.counts = {"accepted": 0, "rejected": 0, "expired": 0, "completed": 0, "failed": 0}
+        self.item_seconds = None
+        self.sequence = itertools.count()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.worker = None
+
+    def start(self):
+        self.queue = asyncio.PriorityQueue()
+        self.worker = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        """
+        Stop taking jobs once the queue has drained.
+        """
+        if self.worker:
+            await self.queue.join()
+            self.worker.cancel()
+        self.executor.shutdown(wait=True)
+
+    def estimated_wait(self, priority: str, items: int = 0):
+        """
+        Estimate the seconds until a new job of the given priority would finish.
+        """
+        ahead = sum(count for p, count in self.queued_items.items() if PRIORITIES[p] <= PRIORITIES[priority])
+        return (ahead + items) * (self.item_seconds or 0)
+
+    def retry_after(self, priority: str):
+        """
+        Seconds a shed or expired request of the given priority should wait before retrying.
+        """
+        return max(1, math.ceil(self.estimated_wait(priority)))
+
+    def reject(self, priority: str, detail: str):
+        self.counts["rejected"] += 1
+        status_code = 503 if priority == "interactive" else 429
+        raise Overloaded(status_code, self.retry_after(priority), detail)
+
+    async def submit(self, items: list, priority: str = "interactive", deadline: float = None, predict=None):
+        """
+        Queue items for inference and wait for the predictions.
+
+        :param items: The item texts to tag.
+        :param priority: The priority class, 'interactive' or 'batch'.
+        :param deadline: (Optional) The time.monotonic() after which the caller has given up.
+        :param predict: (Optional) Run this instead of the scheduler's predict, e.g. for shadow models.
+        :return: The result of predict(items).
+        :raises Overloaded: If the request is shed.
+        :raises DeadlineExceeded: If the deadline passed while the request was queued.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority}")
+
+        if self.queued[priority] >= self.max_queue[priority]:
+            self.reject(priority, f"Too many queued {priority} requests")
+
+        if deadline is not None and time.monotonic() + self.estimated_wait(priority, len(items)) > deadline:
+            self.reject(priority, "Request can't be served before its deadline")
+
+        job = Job(items, priority, deadline, asyncio.get_running_loop().create_future(), predict)
+        self.queued[priority] += 1
+        self.queued_items[priority] += len(items)
+        self.counts["accepted"] += 1
+
+        await self.queue.put((PRIORITIES[priority], next(self.sequence), job))
+        return await job.future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            _, _, job = await self.queue.get()
+            self.queued[job.priority] -= 1
+            self.queued_items[job.priority] -= len(job.items)
+
+            try:
+                if job.future.done():
+                    continue
+
+                # The caller already gave up, don't spend the model on it
+                if job.deadline is not None and time.monotonic() > job.deadline:
+                    self.counts["expired"] += 1
+                    job.future.set_exception(DeadlineExceeded())
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    result = await loop.run_in_executor(self.executor, job.predict or self.predict, job.items)
+                except Exception as e:
+                    self.counts["failed"] += 1
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    continue
+
+                item_seconds = (time.perf_counter() - start) / max(1, len(job.items))
+                self.item_seconds = item_seconds if self.item_seconds is None else \
+                    self.smoothing * item_seconds + (1 - self.smoothing) * self.item_seconds
+
+                self.counts["completed"] += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            except Exception as e:
+                logging.error(f"Error: Scheduler failed to run job. {e}")
+            finally:
+                self.queue.task_done()
+
+    def status(self):
+        return {
+            "queued": dict(self.queued),
+            "queued_items": dict(self.queued_items),
+            "max_queue": self.max_queue,
+            "item_ms": round(self.item_seconds * 1000, 3) if self.item_seconds else None,
+            **self.counts,
+        }
@@ -0,0 +1,130 @@
+import os
+import json
+import zlib
+import torch
+from torch import nn
+
+STUDENT_CONFIG_FILE = "student.json"
+STUDENT_WEIGHTS_FILE = "student.pt"
+
+
+class CharNgramStudent(nn.Module):
+    """
+    fastText style linear classifier over hashed character n-grams and words.
+
+    Distilled from the BERT store type classifier, see model_config/train_student.py.
+    """
+
+    def __init__(self, num_labels: int, num_buckets: int = 2 ** 18, dim: int = 64, min_n: int = 2, max_n: int = 4):
+        super().__init__()
+        self.num_labels = num_labels
+        self.num_buckets = num_buckets
+        self.dim = dim
+        self.min_n = min_n
+        self.max_n = max_n
+        self.embedding = nn.EmbeddingBag(num_buckets, dim, mode="mean")
+        self.classifier = nn.Linear(dim, num_labels)
+
+    def config(self):
+        return {
+            "num_labels": self.num_labels,
+            "num_buckets": self.num_buckets,
+            "dim": self.dim,
+            "min_n": self.min_n,
+            "max_n": self.max_n,
+        }
+
+    def features(self, item: str):
+        """
+        Hash the words and character n-grams of an item into embedding buckets.
+
+        :param item: The item text.
+        :return: A list of bucket IDs.
+        """
+        grams = []
+
+        for word in item.lower().split():
+            grams.append(f"w:{word}")
+            padded = f"<{word}>"
+            for n in range(self.min_n, self.max_n + 1):
+                grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+        return [zlib.crc32(gram.encode()) % self.num_buckets for gram in grams]
+
+    def featurize(self, items: list):
+        """
+        Build the flattened bucket IDs and bag offsets for a batch of items.
+        """
+        ids, offsets = [], []
+
+        for item in items:
+            offsets.append(len(ids))
+            ids.extend(self.features(item))
+
+        return torch.tensor(ids, dtype=torch.long), torch.tensor(offsets, dtype=torch.long)
+
+    def forward(self, ids, offsets):
+        return self.classifier(self.embedding(ids, offsets))
+
+
+class CharNgramClassifier:
+    """ Serving wrapper for a distilled CharNgramStudent artifact """
+
+    def __init__(self, model: CharNgramStudent, label_mapping: dict):
+        self.model = model
+        self.label_mapping = label_mapping
+        self.model.eval()
+
+    @staticmethod
+    def is_artifact(directory: str):
+        return os.path.isfile(os.path.join(directory, STUDENT_CONFIG_FILE))
+
+    @classmethod
+    def load(cls, directory: str, label_mapping: dict):
+        """
+        Load a student artifact saved by save().
+
+        :param directory: The artifact directory.
+        :param label_mapping: The label mapping the student was trained against.
+        """
+        with open(os.path.join(directory, STUDENT_CONFIG_FILE), 'r') as config_file:
+            config = json.load(config_file)
+
+        model = CharNgramStudent(**config)
+        # Only tensors are unpickled, artifacts are loaded from paths supplied over the API
+        weights = torch.load(os.path.join(directory, STUDENT_WEIGHTS_FILE), map_location="cpu", weights_only=True)
+        model.load_state_dict(weights)
+        return cls(model, label_mapping)
+
+    def save(self, directory: str):
+        """
+        Save the student config, weights and label mapping to a directory servable by model_manager.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        with open(os.path.join(directory, STUDENT_CONFIG_FILE), 'w') as config_file:
+            json.dump(self.model.config(), config_file, indent=4)
+
+        with open(os.path.join(directory, "label_mapping.json"), 'w') as labels:
+            json.dump(self.label_mapping, labels, indent=4)
+
+        torch.save(self.model.state_dict(), os.path.join(directory, STUDENT_WEIGHTS_FILE))
+
+    def predict(self, items: list, k: int = 3):
+        """
+        Tag a batch of items.
+
+        :param items: The item texts to tag.
+        :param k: The number of top labels to return per item.
+        :return: A list of (tag, top_tags) tuples, one per item.
+        """
+        with torch.no_grad():
+            logits = self.model(*self.model.featurize(items))
+
+        predicted_labels = torch.argmax(logits, dim=1).tolist()
+        top_labels = torch.topk(logits, k=min(k, logits.shape[1]), dim=1)[1].tolist()
+
+        return [
+            (self.label_mapping[str(label)], [self.label_mapping[str(i)] for i in top])
+            for label, top in zip(predicted_labels, top_labels)
+        ]
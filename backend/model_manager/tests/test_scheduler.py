@@ -0,0 +1,121 @@
+import time
+import asyncio
+import threading
+import pytest
+from scheduler import InferenceScheduler, Overloaded, DeadlineExceeded
+
+
+class Gate:
+    """ Predict function blocking on an event, so tests can queue jobs behind a running one """
+
+    def __init__(self):
+        self.opened = threading.Event()
+        self.calls = []
+
+    def __call__(self, items: list):
+        self.opened.wait(5)
+        self.calls.append(items[0])
+        return items
+
+
+async def started(predict, **kwargs):
+    scheduler = InferenceScheduler(predict, **kwargs)
+    scheduler.start()
+    return scheduler
+
+
+async def settle():
+    # Let submitted jobs reach the queue and the worker pick up the next one
+    await asyncio.sleep(0.05)
+
+
+def test_interactive_runs_before_queued_batch():
+    gate = Gate()
+
+    async def main():
+        scheduler = await started(gate)
+        first = asyncio.ensure_future(scheduler.submit(["first"], "batch"))
+        await settle()
+
+        batch = asyncio.ensure_future(scheduler.submit(["batch"], "batch"))
+        interactive = asyncio.ensure_future(scheduler.submit(["interactive"], "interactive"))
+        await settle()
+
+        gate.opened.set()
+        await asyncio.gather(first, batch, interactive)
+        await scheduler.stop()
+
+    asyncio.run(main())
+    assert gate.calls == ["first", "interactive", "batch"]
+
+
+@pytest.mark.parametrize("priority, status_code", [("interactive", 503), ("batch", 429)])
+def test_full_queue_is_shed_with_retry_after(priority, status_code):
+    gate = Gate()
+
+    async def main():
+        scheduler = await started(gate, max_queue={"interactive": 1, "batch": 1})
+        running = asyncio.ensure_future(scheduler.submit(["running"], priority))
+        await settle()
+        queued = asyncio.ensure_future(scheduler.submit(["queued"], priority))
+        await settle()
+
+        with pytest.raises(Overloaded) as shed:
+            await scheduler.submit(["shed"], priority)
+
+        gate.opened.set()
+        await asyncio.gather(running, queued)
+        await scheduler.stop()
+        return shed.value, scheduler.counts
+
+    shed, counts = asyncio.run(main())
+    assert (shed.status_code, shed.retry_after) == (status_code, 1)
+    assert (counts["accepted"], counts["rejected"], counts["completed"]) == (2, 1, 2)
+
+
+def test_deadline_that_cant_be_met_is_shed():
+    async def main():
+        scheduler = await started(lambda items: items)
+        scheduler.item_seconds = 1.0
+
+        with pytest.raises(Overloaded) as shed:
+            await scheduler.submit(["a", "b"], "interactive", deadline=time.monotonic() + 1.5)
+
+        await scheduler.stop()
+        return shed.value
+
+    shed = asyncio.run(main())
+    assert shed.status_code == 503 and shed.retry_after == 1
+
+
+def test_expired_job_is_dropped_without_running():
+    gate = Gate()
+
+    async def main():
+        scheduler = await started(gate)
+        running = asyncio.ensure_future(scheduler.submit(["running"]))
+        await settle()
+        expiring = asyncio.ensure_future(scheduler.submit(["expiring"], deadline=time.monotonic() + 0.01))
+        await settle()
+
+        gate.opened.set()
+        await running
+        with pytest.raises(DeadlineExceeded):
+            await expiring
+
+        await scheduler.stop()
+        return scheduler.counts
+
+    counts = asyncio.run(main())
+    assert gate.calls == ["running"]
+    assert (counts["expired"], counts["completed"]) == (1, 1)
+
+
+def test_job_can_run_its_own_predict():
+    async def main():
+        scheduler = await started(lambda items: "current")
+        result = await scheduler.submit(["a"], "batch", predict=lambda items: "shadow")
+        await scheduler.stop()
+        return result
+
+    assert asyncio.run(main()) == "shadow"
@@ -3,7 +3,7 @@ import os
 import requests
 import logging
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from lib_db import DatabaseInterface
 from requests.exceptions import ConnectionError, HTTPError
@@ -15,6 +15,7 @@ from exponent_server_sdk import (
     PushTicketError,
 )
 from .models import SearchNearby
+from .prefetch import TrajectoryPrefetcher
 
 
 logging.basicConfig(
@@ -23,12 +24,21 @@ logging.basicConfig(
 )
 
 try:
-    db = DatabaseInterface(os.environ.get('DB_HOST'), os.environ.get('APP_DB'))  
+    db_host = os.environ.get('DB_HOST')
+    db_name = os.environ.get('APP_DB')
+    PREFETCH_CALLS_PER_MINUTE = int(os.environ.get('PREFETCH_CALLS_PER_MINUTE', 30))
+    PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', 2))
+    PREFETCH_HORIZON = float(os.environ.get('PREFETCH_HORIZON_SECONDS', 120))
 except Exception as ex:
     logging.error(f"Error: Missing environment variable. {ex}")
     raise ex
 
-app = FastAPI()
+# Clients are created per worker process on startup, see startup()
+db: DatabaseInterface = None
+push_client: PushClient = None
+prefetcher: TrajectoryPrefetcher = None
+
+app = FastAPI(default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -37,6 +47,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def startup():
+    """
+    Create the database and push notification clients for this worker process.
+    """
+    global db, push_client, prefetcher
+
+    try:
+        db = DatabaseInterface(db_host, db_name)
+        # The SDK only sets its JSON headers on the session it creates itself
+        push_client = PushClient()
+        prefetcher = TrajectoryPrefetcher(
+            db,
+            horizon=PREFETCH_HORIZON,
+            workers=PREFETCH_WORKERS,
+            calls_per_minute=PREFETCH_CALLS_PER_MINUTE)
+        logging.info("Database and push clients initialized")
+    except Exception as ex:
+        logging.error(f"Error: Failed to initialize clients. {ex}")
+        raise ex
+
+@app.on_event("shutdown")
+def shutdown():
+    """
+    Close the database and push notification clients once in-flight requests have drained.
+    """
+    if prefetcher:
+        prefetcher.shutdown()
+    if push_client:
+        push_client.session.close()
+    if db:
+        db.close()
+    logging.info("Database and push clients closed")
+
 def send_push_message(token, message, extra=None):
     """
     Sends a push notification to the specified device token with the provided message and optional extra data.
@@ -52,7 +96,7 @@ def send_push_message(token, message, extra=None):
 
     """
     try:
-        response = PushClient().publish(
+        response = push_client.publish(
             PushMessage(to=token,
                         body=message,
                         data=extra))
@@ -118,6 +162,7 @@ async def search_nearby(body: SearchNearby):
     """
     try:
         print(body)
+        prefetcher.observe(body.list_id, float(body.location.latitude), float(body.location.longitude))
         items = db.find_nearby_items(body.list_id, float(body.location.latitude), float(body.location.longitude), body.radius)
         print(items)
         if items and len(items) == 1 and len(items[0]["stores"]) == 1:
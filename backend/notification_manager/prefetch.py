@@ -0,0 +1,208 @@
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from lib_db import DatabaseInterface
+
+METERS_PER_DEGREE = 111320
+
+BUDGETS = "budgets"
+
+
+class CallBudget:
+    """
+    Limits Places API calls per minute across every worker process.
+
+    The calls of the current minute are counted on a shared document in the database and taken
+    with atomic conditional updates, so the budget doesn't grow with the number of workers.
+    """
+
+    def __init__(self, db: DatabaseInterface, calls_per_minute: int, budget_id: str = "places"):
+        self.db = db
+        self.calls_per_minute = calls_per_minute
+        self.budget_id = budget_id
+
+        # Create the counter first, the unique index keeps concurrent workers from inserting two
+        self.db.create_index(BUDGETS, [("budget_id", 1)], unique=True)
+        self.db.find_one_and_update(BUDGETS, {"budget_id": budget_id}, {"$set": {"budget_id": budget_id}}, upsert=True)
+
+    def take(self):
+        """
+        Take a call from the budget.
+
+        :return: True if the budget allowed the call, otherwise False.
+        """
+        if self.calls_per_minute < 1:
+            return False
+
+        window = int(time.time() // 60)
+
+        # Count the call in the current minute unless it's spent
+        if self.db.find_one_and_update(
+                BUDGETS,
+                {"budget_id": self.budget_id, "window": window, "calls": {"$lt": self.calls_per_minute}},
+                {"$inc": {"calls": 1}}) is not None:
+            return True
+
+        # Otherwise the first call of a new minute resets the counter
+        return self.db.find_one_and_update(
+            BUDGETS,
+            {"budget_id": self.budget_id, "$or": [{"window": {"$lt": window}}, {"window": {"$exists": False}}]},
+            {"$set": {"window": window, "calls": 1}}) is not None
+
+
+class TrajectoryPrefetcher:
+    """
+    Prefetches store data for the tiles a client is about to enter.
+
+    Keeps a short history of geolocation pings per client, estimates heading and speed from it,
+    and loads locations for the tiles along the projected path on a bounded background pool,
+    so pings in a new area hit warm data instead of blocking on the Places API.
+    Pools are per worker process, the Places API budget is shared by all of them.
+    """
+
+    def __init__(self, db: DatabaseInterface, history: int = 5, max_clients: int = 10000,
+                 horizon: float = 120, steps: int = 3, tile_size: float = 0.02, tile_ttl: float = 600,
+                 max_tiles: int = 10000, min_speed: float = 1.0, max_speed: float = 60.0, workers: int = 2,
+                 max_pending: int = 16, calls_per_minute: int = 30):
+        self.db = db
+        self.history = history
+        self.max_clients = max_clients
+        self.horizon = horizon
+        self.steps = steps
+        self.tile_size = tile_size
+        self.tile_ttl = tile_ttl
+        self.max_tiles = max_tiles
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.max_pending = max_pending
+
+        self.pings = OrderedDict()
+        self.tiles = {}
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.budget = CallBudget(db, calls_per_minute)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    def observe(self, client_id: str, latitude: float, longitude: float, timestamp: float = None):
+        """
+        Record a geolocation ping and schedule prefetches along the client's projected path.
+
+        :param client_id: The client (list) ID.
+        :param latitude: The latitude of the ping.
+        :param longitude: The longitude of the ping.
+        :param timestamp: (Optional) The time of the ping, defaults to now.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+
+        with self.lock:
+            pings = self.pings.pop(client_id, None) or deque(maxlen=self.history)
+            pings.append((timestamp, latitude, longitude))
+            self.pings[client_id] = pings
+
+            while len(self.pings) > self.max_clients:
+                self.pings.popitem(last=False)
+
+            points = list(pings)
+
+        for tile in self.predict_tiles(points):
+            self.schedule(tile)
+
+    def estimate(self, points: list):
+        """
+        Estimate the velocity from the oldest to the newest ping.
+
+        :param points: The (timestamp, latitude, longitude) pings, oldest first.
+        :return: The velocity in degrees per second as (latitude, longitude), or None if not moving.
+        """
+        if len(points) < 2:
+            return None
+
+        (t0, lat0, lng0), (t1, lat1, lng1) = points[0], points[-1]
+        elapsed = t1 - t0
+        if elapsed <= 0:
+            return None
+
+        lat_rate = (lat1 - lat0) / elapsed
+        lng_rate = (lng1 - lng0) / elapsed
+
+        speed = math.hypot(lat_rate, lng_rate * math.cos(math.radians(lat1))) * METERS_PER_DEGREE
+        if speed < self.min_speed or speed > self.max_speed:
+            return None
+
+        return lat_rate, lng_rate
+
+    def tile(self, latitude: float, longitude: float):
+        return math.floor(latitude / self.tile_size), math.floor(longitude / self.tile_size)
+
+    def predict_tiles(self, points: list):
+        """
+        Project the latest ping along the estimated velocity over the prefetch horizon.
+
+        :return: The tiles along the projected path that the client is not in yet.
+        """
+        velocity = self.estimate(points)
+        if velocity is None:
+            return []
+
+        _, latitude, longitude = points[-1]
+        current = self.tile(latitude, longitude)
+        tiles = []
+
+        for step in range(1, self.steps + 1):
+            seconds = self.horizon * step / self.steps
+            tile = self.tile(latitude + velocity[0] * seconds, longitude + velocity[1] * seconds)
+
+            if tile != current and tile not in tiles:
+                tiles.append(tile)
+
+        return tiles
+
+    def schedule(self, tile: tuple):
+        """
+        Queue a tile for prefetching unless it was recently handled or the pool is saturated.
+        """
+        now = time.time()
+
+        with self.lock:
+            if self.tiles.get(tile, 0) > now or self.pending >= self.max_pending:
+                return
+
+            self.tiles[tile] = now + self.tile_ttl
+            self.pending += 1
+
+            # Forget expired tiles so the map stays bounded
+            if len(self.tiles) > self.max_tiles:
+                self.tiles = {t: expiry for t, expiry in self.tiles.items() if expiry > now}
+
+        self.executor.submit(self.prefetch, tile)
+
+    def prefetch(self, tile: tuple):
+        """
+        Load locations around the center of a tile if the database has none there yet.
+        """
+        try:
+            latitude = (tile[0] + 0.5) * self.tile_size
+            longitude = (tile[1] + 0.5) * self.tile_size
+
+            if self.db.has_nearby_locations("locations", [latitude, longitude], 3000) is not False:
+                return
+
+            if not self.budget.take():
+                logging.info(f"Prefetch budget exhausted, skipping tile {tile}")
+                with self.lock:
+                    self.tiles.pop(tile, None)
+                return
+
+            logging.info(f"Prefetching locations for tile {tile}")
+            self.db.load_locations(latitude, longitude)
+        except Exception as e:
+            logging.error(f"Error prefetch failed. {e}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,225 @@
+"""
+Distill the BERT store type classifier into a lightweight char n-gram student.
+
+The student is trained on the teacher's softened predictions together with the
+labelled items from ./content, evaluated against the teacher on a held out split,
+and saved as an artifact model_manager can serve (POST /api/model/load with X-Admin-Token).
+
+Usage:
+    python train_student.py --data "./content/*.csv" --output ./student_model
+"""
+import os
+import sys
+import glob
+import json
+import time
+import random
+import logging
+import argparse
+import pandas as pd
+import torch
+from torch import nn, optim
+from torch.nn import functional as F
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+# The student model definition is shared with model_manager so the artifact is served as trained
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend", "model_manager"))
+from student import CharNgramStudent, CharNgramClassifier  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", nargs="+", default=["./content/*.csv"],
+                        help="CSV files or glob patterns, files without 'item' and 'store_type' columns are skipped")
+    parser.add_argument("--labels", default="../backend/label_mapping.json", help="The teacher's label mapping")
+    parser.add_argument("--teacher", default="beny2000/store_type_classifyer", help="Teacher hub name or directory")
+    parser.add_argument("--output", default="./student_model", help="Directory to write the student artifact to")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--learning-rate", type=float, default=0.05)
+    parser.add_argument("--temperature", type=float, default=2.0, help="Softmax temperature of the distillation loss")
+    parser.add_argument("--alpha", type=float, default=0.7, help="Weight of the distillation loss against the label loss")
+    parser.add_argument("--buckets", type=int, default=2 ** 18, help="Number of hashed n-gram buckets")
+    parser.add_argument("--dim", type=int, default=64, help="Embedding dimension")
+    parser.add_argument("--latency-samples", type=int, default=200, help="Items timed for the per-item latency report")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def load_dataset(data_patterns: list, label_mapping: dict):
+    """
+    Load the labelled items of every matching CSV, keeping only store types the teacher can predict.
+    """
+    label_ids = {label: int(i) for i, label in label_mapping.items()}
+    frames = []
+
+    for data_filepath in sorted({path for pattern in data_patterns for path in glob.glob(pattern)}):
+        frame = pd.read_csv(data_filepath)
+
+        if not {"item", "store_type"}.issubset(frame.columns):
+            logging.info(f"Skipping {data_filepath}, it has no 'item' and 'store_type' columns")
+            continue
+
+        logging.info(f"Reading {len(frame)} rows from {data_filepath}")
+        frames.append(frame[["item", "store_type"]])
+
+    if not frames:
+        raise ValueError(f"No labelled items found in {data_patterns}")
+
+    df = pd.concat(frames, ignore_index=True).dropna()
+    df["item"] = df["item"].astype(str).str.strip()
+    df = df.drop_duplicates(subset="item")
+
+    known = df["store_type"].isin(label_ids)
+    logging.info(f"Loaded {len(df)} items, dropped {(~known).sum()} with store types unknown to the teacher")
+
+    df = df[known].reset_index(drop=True)
+    df["label"] = df["store_type"].map(label_ids)
+    return df
+
+
+def teacher_logits(model, tokenizer, items: list, batch_size: int):
+    """
+    Run the teacher over the items in batches.
+    """
+    logits = []
+
+    with torch.no_grad():
+        for i in range(0, len(items), batch_size):
+            inputs = tokenizer(items[i:i + batch_size], return_tensors="pt", padding=True, truncation=True)
+            logits.append(model(**inputs).logits)
+
+    return torch.cat(logits)
+
+
+def train_student(student: CharNgramStudent, items: list, labels: torch.Tensor, soft_targets: torch.Tensor, args):
+    """
+    Train the student on the teacher's softened logits and the true labels.
+    """
+    optimizer = optim.Adam(student.parameters(), lr=args.learning_rate)
+    criterion = nn.CrossEntropyLoss()
+    temperature = args.temperature
+    indices = list(range(len(items)))
+
+    for epoch in range(args.epochs):
+        student.train()
+        random.shuffle(indices)
+        total_loss = 0
+
+        for i in range(0, len(indices), args.batch_size):
+            batch = indices[i:i + args.batch_size]
+            ids, offsets = student.featurize([items[j] for j in batch])
+
+            optimizer.zero_grad()
+            logits = student(ids, offsets)
+
+            distillation_loss = F.kl_div(
+                F.log_softmax(logits / temperature, dim=1),
+                F.softmax(soft_targets[batch] / temperature, dim=1),
+                reduction="batchmean") * temperature ** 2
+            label_loss = criterion(logits, labels[batch])
+
+            loss = args.alpha * distillation_loss + (1 - args.alpha) * label_loss
+            loss.backward()
+            optimizer.step()
+
+            total_loss += loss.item() * len(batch)
+
+        logging.info(f"Epoch {epoch + 1}/{args.epochs} - Training Loss: {total_loss / len(items):.4f}")
+
+    student.eval()
+    return student
+
+
+def per_item_latency(predict, items: list):
+    """
+    Time single item predictions, as model_manager serves them.
+
+    :return: The mean and p95 latency in milliseconds.
+    """
+    latencies = []
+
+    for item in items:
+        start = time.perf_counter()
+        predict(item)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    return {
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+    }
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    # Latency is reported for CPU serving, as in model_manager
+    device = "cpu"
+
+    with open(args.labels, 'r') as labels:
+        label_mapping = json.load(labels)
+
+    df = load_dataset(args.data, label_mapping)
+
+    # Split the dataset into training, validation, and testing sets as in model_training.ipynb
+    train_df, temp_df = train_test_split(df, test_size=0.2, random_state=args.seed)
+    valid_df, test_df = train_test_split(temp_df, test_size=0.5, random_state=args.seed)
+
+    logging.info(f"Loading teacher {args.teacher}")
+    tokenizer = AutoTokenizer.from_pretrained(args.teacher)
+    teacher = AutoModelForSequenceClassification.from_pretrained(args.teacher).to(device)
+    teacher.eval()
+
+    train_items = train_df["item"].tolist()
+    soft_targets = teacher_logits(teacher, tokenizer, train_items, args.batch_size)
+
+    student = CharNgramStudent(len(label_mapping), num_buckets=args.buckets, dim=args.dim)
+    student = train_student(
+        student, train_items, torch.tensor(train_df["label"].values, dtype=torch.long), soft_targets, args)
+    classifier = CharNgramClassifier(student, label_mapping)
+
+    report = {"teacher": args.teacher, "train_items": len(train_df)}
+
+    for split, split_df in [("valid", valid_df), ("test", test_df)]:
+        items = split_df["item"].tolist()
+        teacher_preds = torch.argmax(teacher_logits(teacher, tokenizer, items, args.batch_size), dim=1).tolist()
+        with torch.no_grad():
+            student_preds = torch.argmax(student(*student.featurize(items)), dim=1).tolist()
+
+        report[split] = {
+            "items": len(items),
+            "teacher_accuracy": round(accuracy_score(split_df["label"], teacher_preds), 4),
+            "student_accuracy": round(accuracy_score(split_df["label"], student_preds), 4),
+            "agreement": round(accuracy_score(teacher_preds, student_preds), 4),
+        }
+
+    latency_items = test_df["item"].tolist()[:args.latency_samples]
+
+    def teacher_predict(item):
+        with torch.no_grad():
+            return teacher(**tokenizer(item, return_tensors="pt")).logits
+
+    report["teacher_latency"] = per_item_latency(teacher_predict, latency_items)
+    report["student_latency"] = per_item_latency(lambda item: classifier.predict([item]), latency_items)
+    report["speedup"] = round(report["teacher_latency"]["mean_ms"] / report["student_latency"]["mean_ms"], 1)
+
+    classifier.save(args.output)
+    with open(os.path.join(args.output, "report.json"), 'w') as report_file:
+        json.dump(report, report_file, indent=4)
+
+    print(json.dumps(report, indent=4))
+    logging.info(f"Student saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()